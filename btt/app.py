@@ -1,6 +1,7 @@
 """Module that runs application in development mode."""
 
 import os
+import time
 import click
 from btt import create_app
 from btt.database import (
@@ -12,9 +13,20 @@ from btt.database import (
     Group,
     MemberShip,
     create_db,
+    stem_descriptions,
 )
 import unittest
-from btt.classification import classification_score
+from btt.jobs import run_worker
+from btt.classification import classification_score, training_window
+from btt.benchmark import (
+    BENCHMARK_ALGORITHMS,
+    benchmark_datasets,
+    evaluate_groups,
+    evaluation_group_ids,
+    run_benchmark,
+    summarise_results,
+    write_results,
+)
 
 
 app = create_app(os.getenv("FLASK_CONFIG") or "default")
@@ -57,10 +69,164 @@ def newdb():
 
 
 @app.cli.command()
-@click.argument("group_id")
-def classify(group_id):
+@click.option("--processes", type=int, help="Number of worker processes.")
+def worker(processes):
+    """Run background jobs such as category model training."""
+    processes = processes or app.config["WORKER_PROCESSES"]
+    print("Running background jobs in {} processes...".format(processes))
+    run_worker(os.getenv("FLASK_CONFIG") or "default", processes)
+
+
+@app.cli.command()
+@click.argument("group_id", required=False)
+@click.option(
+    "--benchmark",
+    is_flag=True,
+    help="Benchmark algorithms on the group, a dataset or generated data.",
+)
+@click.option(
+    "--algorithm",
+    "algorithms",
+    multiple=True,
+    type=click.Choice(BENCHMARK_ALGORITHMS),
+    help="Algorithm to benchmark, default all.",
+)
+@click.option(
+    "--dataset",
+    type=click.Path(exists=True),
+    help="CSV file with description and category columns to benchmark.",
+)
+@click.option(
+    "--sizes",
+    default="1000,5000,20000",
+    show_default=True,
+    help="Comma separated dataset sizes to benchmark.",
+)
+@click.option("--folds", default=5, show_default=True, help="Number of folds.")
+@click.option(
+    "--features",
+    default="tfidf",
+    show_default=True,
+    type=click.Choice(["tfidf", "hashing"]),
+    help="Features to benchmark.",
+)
+@click.option("--output", type=click.Path(), help="Write results to JSON file.")
+def classify(group_id, benchmark, algorithms, dataset, sizes, folds, features, output):
     """Test transaction categorization for email."""
+    if benchmark:
+        sizes = [int(size) for size in sizes.split(",")]
+        datasets = benchmark_datasets(sizes, group_id=group_id, filename=dataset)
+        results = []
+        print(
+            "Dataset          Size Algorithm       Accuracy  Fit (s) "
+            "Predict (ms/row) Peak Memory (MB)"
+        )
+        for result in run_benchmark(
+            datasets, algorithms or BENCHMARK_ALGORITHMS, folds, features
+        ):
+            print(
+                "{dataset:<12.12} {size:>8} {algorithm:<15} {accuracy:>8.3f} "
+                "{fit_time:>8.3f} {latency:>16.4f} {peak:>16.1f}".format(
+                    latency=result["predict_latency"] * 1000,
+                    peak=result["peak_memory"] / 2**20,
+                    **result,
+                )
+            )
+            results.append(result)
+        if output:
+            write_results(output, results)
+        return
+    if group_id is None:
+        raise click.UsageError("GROUP_ID is required unless benchmarking.")
     score, data_size, num_features = classification_score(group_id)
     print("Score: ", score)
     print("Data Size: ", data_size)
     print("Number of Features: ", num_features)
+
+
+@app.cli.command()
+@click.option(
+    "--group", "group_ids", multiple=True, type=int, help="Group to evaluate."
+)
+@click.option(
+    "--algorithm",
+    "algorithms",
+    multiple=True,
+    type=click.Choice(BENCHMARK_ALGORITHMS),
+    help="Algorithm to evaluate, default the configured algorithm.",
+)
+@click.option("--folds", default=5, show_default=True, help="Number of folds.")
+@click.option(
+    "--features",
+    type=click.Choice(["tfidf", "hashing"]),
+    help="Features to evaluate, default the configured features.",
+)
+@click.option(
+    "--min-transactions",
+    default=20,
+    show_default=True,
+    help="Skip groups with fewer transactions.",
+)
+@click.option(
+    "--window",
+    is_flag=True,
+    help="Compare training in the configured window with training on all.",
+)
+@click.option("--processes", type=int, help="Number of worker processes.")
+@click.option("--output", type=click.Path(), help="Write results to JSON file.")
+def evaluate(
+    group_ids, algorithms, folds, features, min_transactions, window, processes, output
+):
+    """Evaluate categorization across all groups or chosen groups."""
+    group_ids = evaluation_group_ids(group_ids, max(min_transactions, folds))
+    algorithms = algorithms or [app.config["CLASSIFIER_ALGORITHM"]]
+    features = features or app.config["CLASSIFIER_FEATURES"]
+    processes = processes or app.config["WORKER_PROCESSES"]
+    print("Evaluating {} groups in {} processes...".format(len(group_ids), processes))
+    print(
+        "   Group     Size Algorithm       Training Accuracy  Fit (s) "
+        "Peak Memory (MB)"
+    )
+    start = time.perf_counter()
+    results = []
+    for result in evaluate_groups(
+        os.getenv("FLASK_CONFIG") or "default",
+        group_ids,
+        algorithms,
+        folds,
+        features,
+        processes,
+        training_window() if window else None,
+    ):
+        print(
+            "{group_id:>8} {size:>8} {algorithm:<15} {training:<8} {accuracy:>8.3f} "
+            "{fit_time:>8.3f} {peak:>16.1f}".format(
+                peak=result["peak_memory"] / 2**20, **result
+            )
+        )
+        results.append(result)
+    summary = summarise_results(results)
+    print()
+    print(
+        "Algorithm       Training Groups     Size Accuracy Weighted  Minimum   "
+        "Median Total Fit (s) Max Fit (s)"
+    )
+    for row in summary:
+        print(
+            "{algorithm:<15} {training:<8} {groups:>6} {size:>8} {accuracy:>8.3f} "
+            "{weighted_accuracy:>8.3f} {min_accuracy:>8.3f} "
+            "{median_accuracy:>8.3f} {fit_time:>13.1f} {max_fit_time:>11.3f}".format(
+                **row
+            )
+        )
+    print("Elapsed (s): {:.1f}".format(time.perf_counter() - start))
+    if output:
+        write_results(output, results, summary)
+
+
+@app.cli.command()
+@click.option("--restem", is_flag=True, help="Restem all transactions.")
+def stem(restem):
+    """Store stemmed descriptions and fingerprints of existing transactions."""
+    count = stem_descriptions(restem=restem)
+    print("Transactions stemmed: ", count)
@@ -17,7 +17,7 @@ from .errors import error
 from .auth.views import auth
 from config import config
 from .email import mail
-
+from . import querybudget
 
 sess = Session()
 bootstrap = Bootstrap()
@@ -50,6 +50,7 @@ def create_app(config_name):
     app.register_blueprint(web)
     app.register_blueprint(error)
     app.register_blueprint(auth)
+    querybudget.init_app(app)
     # paranoid.init_app(app)
     # paranoid.redirect_view = '/'
     if not app.debug:
@@ -16,6 +16,7 @@ from datetime import datetime
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.exc import IntegrityError
 from ..database import User, Group, MemberShip
+from ..querybudget import query_budget
 from .forms import (
     LoginForm,
     RegistrationForm,
@@ -246,6 +247,7 @@ def change_email(token):
 
 
 @auth.route("/delete_user", methods=["GET", "POST"])
+@query_budget(100)  # Deletes a group's categories and accounts one at a time
 @login_required
 def delete_user():
     """Delete user and data."""
@@ -0,0 +1,390 @@
+"""Module that benchmarks transaction categorisation algorithms."""
+
+import csv
+import datetime
+import json
+import multiprocessing
+import platform
+import random
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import sklearn
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import KFold
+from .classification import (
+    ALGORITHMS,
+    CategoryModel,
+    OnlineCategoryModel,
+    collect_data_for_group,
+    read_training_rows,
+    weight_training_rows,
+)
+from .database import db, Transaction
+from . import jobs
+from .text import stem_description
+
+# Algorithms that can be benchmarked, including the online category model
+BENCHMARK_ALGORITHMS = list(ALGORITHMS) + ["online"]
+
+# Fraction of a group's most recent transactions held out when comparing
+# training windows
+WINDOW_TEST_FRACTION = 0.2
+
+
+def generate_dataset(size, num_categories=30, vocabulary_size=6000, seed=42):
+    """Generate stemmed descriptions and categories resembling transactions.
+
+    Each category has a set of merchants whose names are drawn from the
+    vocabulary, and each description is a merchant name plus a random
+    word and a reference number.
+    """
+    rng = random.Random(seed)
+    words = [
+        "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=7))
+        for _ in range(vocabulary_size)
+    ]
+    merchants = {
+        "Category {}".format(num): [rng.sample(words, 3) for _ in range(60)]
+        for num in range(num_categories)
+    }
+    categories = list(merchants)
+    feature_data = []
+    label_data = []
+    for _ in range(size):
+        category = rng.choice(categories)
+        description = rng.choice(merchants[category]) + [
+            rng.choice(words),
+            str(rng.randrange(100000)),
+        ]
+        feature_data.append(stem_description(" ".join(description)))
+        label_data.append(category)
+    return feature_data, label_data
+
+
+def load_dataset(filename):
+    """Load stemmed descriptions and categories from a CSV file.
+
+    The file has a header row with description and category columns.
+    """
+    feature_data = []
+    label_data = []
+    with open(filename, newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            feature_data.append(stem_description(row["description"]))
+            label_data.append(row["category"])
+    return feature_data, label_data
+
+
+def make_category_model(algorithm, labels, features="tfidf"):
+    """Make an unfitted category model for algorithm."""
+    if algorithm == "online":
+        return OnlineCategoryModel(set(labels))
+    return CategoryModel(algorithm, features)
+
+
+def evaluate_algorithm(
+    algorithm,
+    features_train,
+    labels_train,
+    features_test,
+    labels_test,
+    memory=True,
+    features="tfidf",
+    sample_weight=None,
+):
+    """Measure accuracy, latency and peak memory of a category model.
+
+    Memory is measured in a second run as tracing allocations slows it down.
+    """
+    classes = labels_train + labels_test
+    start = time.perf_counter()
+    model = make_category_model(algorithm, classes, features)
+    model.fit(features_train, labels_train, sample_weight)
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    predict = model.predict(features_test)
+    predict_time = time.perf_counter() - start
+    peak_memory = None
+    if memory:
+        tracemalloc.start()
+        model = make_category_model(algorithm, classes, features)
+        model.fit(features_train, labels_train, sample_weight).predict(features_test)
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "algorithm": algorithm,
+        "accuracy": accuracy_score(labels_test, predict),
+        "fit_time": fit_time,
+        "predict_latency": predict_time / max(len(features_test), 1),
+        "peak_memory": peak_memory,
+    }
+
+
+def cross_validate(algorithm, feature_data, label_data, folds=5, features="tfidf"):
+    """Evaluate algorithm with k-fold cross validation.
+
+    Times and accuracy are averaged over the folds. Peak memory is measured
+    on the first fold only.
+    """
+    results = []
+    kfold = KFold(n_splits=folds, shuffle=True, random_state=42)
+    for num, (train, test) in enumerate(kfold.split(feature_data)):
+        results.append(
+            evaluate_algorithm(
+                algorithm,
+                [feature_data[i] for i in train],
+                [label_data[i] for i in train],
+                [feature_data[i] for i in test],
+                [label_data[i] for i in test],
+                memory=num == 0,
+                features=features,
+            )
+        )
+    accuracies = [result["accuracy"] for result in results]
+    mean_accuracy = sum(accuracies) / folds
+    return {
+        "algorithm": algorithm,
+        "features": features,
+        "folds": folds,
+        "accuracy": mean_accuracy,
+        "accuracy_std": (
+            sum((accuracy - mean_accuracy) ** 2 for accuracy in accuracies) / folds
+        )
+        ** 0.5,
+        "fit_time": sum(result["fit_time"] for result in results) / folds,
+        "predict_latency": sum(result["predict_latency"] for result in results) / folds,
+        "peak_memory": results[0]["peak_memory"],
+    }
+
+
+def run_benchmark(datasets, algorithms, folds=5, features="tfidf"):
+    """Cross validate algorithms on datasets, yielding a result for each.
+
+    datasets is a list of (name, feature_data, label_data) tuples.
+    """
+    for name, feature_data, label_data in datasets:
+        for algorithm in algorithms:
+            result = cross_validate(
+                algorithm, feature_data, label_data, folds, features
+            )
+            result["dataset"] = name
+            result["size"] = len(feature_data)
+            yield result
+
+
+def benchmark_datasets(sizes, group_id=None, filename=None):
+    """Get datasets of increasing size from a group, a file or generated.
+
+    Datasets taken from a group or file are random samples of the full data.
+    """
+    if group_id is None and filename is None:
+        return [("generated",) + generate_dataset(size) for size in sorted(sizes)]
+    if group_id is not None:
+        name = "group {}".format(group_id)
+        feature_data, label_data = collect_data_for_group(group_id)
+    else:
+        name = filename
+        feature_data, label_data = load_dataset(filename)
+    sizes = sorted(size for size in sizes if size < len(feature_data))
+    datasets = []
+    for size in sizes:
+        sample = random.Random(42).sample(range(len(feature_data)), size)
+        datasets.append(
+            (
+                name,
+                [feature_data[i] for i in sample],
+                [label_data[i] for i in sample],
+            )
+        )
+    datasets.append((name, feature_data, label_data))
+    return datasets
+
+
+def evaluation_group_ids(group_ids=None, min_transactions=20):
+    """Get ids of groups with enough transactions to evaluate.
+
+    Groups are ordered largest first so the slowest ones start earliest.
+    """
+    query = (
+        db.session.query(Transaction.group_id)
+        .group_by(Transaction.group_id)
+        .having(db.func.count() >= min_transactions)
+        .order_by(db.func.count().desc(), Transaction.group_id)
+    )
+    if group_ids:
+        query = query.filter(Transaction.group_id.in_(group_ids))
+    return [group_id for group_id, in query]
+
+
+def compare_training_window(
+    algorithm, rows, window_rows, window, num_test, features="tfidf"
+):
+    """Compare training on all older transactions with training in window.
+
+    rows are (stemmed description, category name, date), most recent first.
+    The num_test most recent transactions are held out for testing, as the
+    model is used to categorise transactions newer than those it was trained
+    on. window_rows are the older rows that fall in the training window.
+    """
+    features_test = [row[0] for row in rows[:num_test]]
+    labels_test = [row[1] for row in rows[:num_test]]
+    results = []
+    for training in ["all", "window"]:
+        if training == "all":
+            features_train = [row[0] for row in rows[num_test:]]
+            labels_train = [row[1] for row in rows[num_test:]]
+            weights = None
+        else:
+            features_train, labels_train, weights = weight_training_rows(
+                window_rows, window
+            )
+        result = evaluate_algorithm(
+            algorithm,
+            features_train,
+            labels_train,
+            features_test,
+            labels_test,
+            features=features,
+            sample_weight=weights,
+        )
+        result["features"] = features
+        result["training"] = training
+        result["train_size"] = len(features_train)
+        results.append(result)
+    return results
+
+
+def evaluate_group(group_id, algorithms, folds=5, features="tfidf", window=None):
+    """Evaluate algorithms on a group, returning a result for each.
+
+    Without a training window algorithms are cross validated on all of the
+    group's transactions. With one, training in the window is compared with
+    training on all transactions, testing on the most recent transactions.
+    """
+    start = time.perf_counter()
+    if window is None:
+        feature_data, label_data = collect_data_for_group(group_id)
+    else:
+        rows = read_training_rows(group_id)
+        label_data = [row[1] for row in rows]
+        num_test = max(int(len(rows) * WINDOW_TEST_FRACTION), 1)
+        window_rows = read_training_rows(group_id, window, skip=num_test)
+    load_time = time.perf_counter() - start
+    results = []
+    for algorithm in algorithms:
+        if window is None:
+            algorithm_results = [
+                cross_validate(algorithm, feature_data, label_data, folds, features)
+            ]
+            algorithm_results[0]["training"] = "all"
+        else:
+            algorithm_results = compare_training_window(
+                algorithm, rows, window_rows, window, num_test, features=features
+            )
+        for result in algorithm_results:
+            result["group_id"] = group_id
+            result["size"] = len(label_data)
+            result["categories"] = len(set(label_data))
+            result["load_time"] = load_time
+            results.append(result)
+    return results
+
+
+def evaluate_group_in_worker_process(group_id, algorithms, folds, features, window):
+    """Evaluate a group in a worker process."""
+    with jobs._worker_app.app_context():
+        return evaluate_group(group_id, algorithms, folds, features, window)
+
+
+def evaluate_groups(
+    config_name,
+    group_ids,
+    algorithms,
+    folds=5,
+    features="tfidf",
+    processes=1,
+    window=None,
+):
+    """Evaluate groups in a process pool, yielding results as groups finish.
+
+    Each worker process is replaced after one group, so memory used by a
+    large group is returned to the system before the next group starts.
+    """
+    executor = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=jobs.init_worker_process,
+        initargs=(config_name,),
+        max_tasks_per_child=1,
+    )
+    with executor:
+        futures = [
+            executor.submit(
+                evaluate_group_in_worker_process,
+                group_id,
+                algorithms,
+                folds,
+                features,
+                window,
+            )
+            for group_id in group_ids
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def summarise_results(results):
+    """Aggregate group results per algorithm and training data.
+
+    Accuracy is given both as the mean over groups and weighted by the
+    number of transactions in each group.
+    """
+    summaries = []
+    for algorithm, training in dict.fromkeys(
+        (result["algorithm"], result["training"]) for result in results
+    ):
+        group_results = [
+            r
+            for r in results
+            if r["algorithm"] == algorithm and r["training"] == training
+        ]
+        accuracies = sorted(r["accuracy"] for r in group_results)
+        size = sum(r["size"] for r in group_results)
+        summaries.append(
+            {
+                "algorithm": algorithm,
+                "training": training,
+                "groups": len(group_results),
+                "size": size,
+                "accuracy": sum(accuracies) / len(accuracies),
+                "weighted_accuracy": sum(
+                    r["accuracy"] * r["size"] for r in group_results
+                )
+                / size,
+                "min_accuracy": accuracies[0],
+                "median_accuracy": accuracies[len(accuracies) // 2],
+                "fit_time": sum(r["fit_time"] for r in group_results),
+                "max_fit_time": max(r["fit_time"] for r in group_results),
+                "peak_memory": max(r["peak_memory"] for r in group_results),
+            }
+        )
+    return summaries
+
+
+def write_results(filename, results, summary=None):
+    """Write benchmark results and environment to a JSON file."""
+    output = {
+        "created": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "sklearn": sklearn.__version__,
+        "results": results,
+    }
+    if summary is not None:
+        output["summary"] = summary
+    with open(filename, "w") as jsonfile:
+        json.dump(
+            output,
+            jsonfile,
+            indent=2,
+        )
@@ -1,18 +1,63 @@
 """Module that uses machine learning techniques to categorise transactions."""
 
-import string
-from dateutil.parser import parse
-from nltk.stem.snowball import SnowballStemmer
+import datetime
+import multiprocessing
+import pickle
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
 from sklearn import model_selection
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import (
+    HashingVectorizer,
+    TfidfTransformer,
+    TfidfVectorizer,
+)
 from sklearn.feature_selection import SelectPercentile, f_classif
-from sklearn.naive_bayes import GaussianNB
+from sklearn.naive_bayes import ComplementNB, GaussianNB, MultinomialNB
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline, make_pipeline
 from sklearn.metrics import accuracy_score
 from sklearn import preprocessing
 from sklearn import svm
-from flask_login import current_user
-from flask import session
-from .database import db, Transaction, Category
+from flask import current_app
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from .database import db, Transaction, Category, ClassifierModel, Group
+from .jobs import enqueue_job, job_handler
+from .text import merchant_key, stem_description
+from .columns import infer_columns
+from .uploads import sample_upload_rows
+
+# Category models recently used by this process, keyed by group_id
+_model_cache = OrderedDict()
+
+# Maximum number of merchant keys looked up per query
+LOOKUP_CHUNK_SIZE = 500
+
+# Size of hashed feature space and of chunks of descriptions hashed at once
+HASH_FEATURES = 2**13
+CHUNK_SIZE = 10000
+
+# Limits on the transactions a category model is trained on, zero meaning
+# no limit, and the half life in months of their weights, zero meaning equal
+TrainingWindow = namedtuple(
+    "TrainingWindow",
+    ["max_transactions", "max_months", "category_quota", "half_life_months"],
+)
+
+# Training on all of a group's transactions with equal weights
+ALL_TRANSACTIONS = TrainingWindow(0, 0, 0, 0)
+
+DAYS_PER_MONTH = 365.25 / 12
+
+# Classifiers for batch category models and whether they need dense input
+ALGORITHMS = {
+    "gaussian_nb": (GaussianNB, True),
+    "multinomial_nb": (lambda: MultinomialNB(alpha=0.1), False),
+    "complement_nb": (lambda: ComplementNB(alpha=0.3), False),
+    "linear_svm": (lambda: SGDClassifier(random_state=42), False),
+    "svc": (lambda: make_pipeline(preprocessing.StandardScaler(), svm.SVC()), True),
+}
 
 
 def classification_score(group_id):
@@ -36,100 +81,369 @@ def classification_score(group_id):
     return score, data_size, num_features
 
 
-def predict_categories():
-    """Predict transaction categories."""
-    features_train, labels_train = collect_data()
-    features_test = get_test_features()
-    if len(features_train) == 0:
-        predict = ["Unspecified Expense" for _ in features_test]
-        return predict
-    features_train, features_test, num_features = vectorize_data(
-        features_train, features_test
-    )
-    features_train, features_test = feature_selection(
-        features_train, features_test, labels_train
+def categorise_descriptions(group, descriptions):
+    """Predict categories of descriptions for group.
+
+    Descriptions with the merchant key of an existing transaction get the
+    category most recently given to that merchant. The category model is
+    only used for the remaining unseen descriptions.
+    """
+    predict = lookup_categories(
+        group.group_id, [merchant_key(description) for description in descriptions]
     )
-    predict = naive_bayes_predict(features_train, labels_train, features_test)
+    unseen = [num for num, catname in enumerate(predict) if catname is None]
+    if not unseen:
+        return predict
+    model = get_category_model(group)
+    if model is None:
+        catnames = ["Unspecified Expense" for _ in unseen]
+    else:
+        catnames = model.predict(
+            [stem_description(descriptions[num]) for num in unseen]
+        )
+    for num, catname in zip(unseen, catnames):
+        predict[num] = catname
     return predict
 
 
-def predict_columns():
-    """Predict transaction column labels."""
-    transactions = session["uploaded_transactions"]
-    result = ["ignore" for _ in range(len(transactions[0]))]
-    header_row = False
-    for i, value in enumerate(transactions[0]):
-        if "date" in value.lower():
-            result[i] = "date"
-            header_row = True
-        elif "description" in value.lower() or "narration" in value.lower():
-            result[i] = "description"
-            header_row = True
-        elif "dr" in value.lower() and "cr" in value.lower() and len(value) < 6:
-            result[i] = "drcr"
-            header_row = True
-        elif "debit" in value.lower():
-            result[i] = "dr"
-            header_row = True
-        elif "dr" in value.lower() and len(value) < 5:
-            result[i] = "dr"
-            header_row = True
-        elif "credit" in value.lower():
-            result[i] = "cr"
-            header_row = True
-        elif "cr" in value.lower() and len(value) < 5:
-            result[i] = "cr"
-            header_row = True
-    if not header_row:
-        for i, value in enumerate(transactions[1]):
-            if is_number(value):
-                result[i] = "drcr"
-            elif is_date(value):
-                result[i] = "date"
-            elif len(value) > 10:
-                result[i] = "description"
-    return result, header_row
-
-
-def is_date(a_string):
-    """Is string a date."""
-    try:
-        parse(a_string)
+def lookup_categories(group_id, keys):
+    """Look up most recent category of group's transactions with merchant keys.
+
+    Return a category name, or None if unseen, for each key.
+    """
+    unique_keys = list({key for key in keys if key})
+    categories = {}
+    for start in range(0, len(unique_keys), LOOKUP_CHUNK_SIZE):
+        rows = (
+            db.session.query(Transaction.merchant_key, Category.catname)
+            .filter(Transaction.group_id == group_id)
+            .filter(
+                Transaction.merchant_key.in_(
+                    unique_keys[start : start + LOOKUP_CHUNK_SIZE]
+                )
+            )
+            .filter(Transaction.catno == Category.catno)
+            .order_by(Transaction.date, Transaction.transno)
+            .all()
+        )
+        categories.update(rows)  # Most recent transaction last
+    return [categories.get(key) for key in keys]
+
+
+class CategoryModel:
+    """Trained vectorizer, feature selector and classifier for a group.
+
+    Features stay as sparse matrices unless the algorithm needs dense input.
+    With hashing features the vocabulary is not stored, only the IDF weight
+    of each hashed feature, so descriptions can be featurized in chunks
+    across processes and the model size does not grow with the vocabulary.
+    """
+
+    def __init__(self, algorithm="gaussian_nb", features="tfidf", processes=1):
+        """Initialise with the name of one of ALGORITHMS and a feature mode."""
+        classifier, dense = ALGORITHMS[algorithm]
+        self.algorithm = algorithm
+        self.dense = dense
+        self.features = features
+        self.processes = processes
+        if features == "hashing":
+            self.vectorizer = HashingVectorizer(
+                n_features=HASH_FEATURES,
+                alternate_sign=False,
+                norm=None,
+                stop_words="english",
+            )
+            self.transformer = TfidfTransformer(sublinear_tf=True)
+            self.selector = None  # Unused hashed features would be constant
+        else:
+            self.vectorizer = TfidfVectorizer(
+                sublinear_tf=True, max_df=0.5, stop_words="english"
+            )
+            self.transformer = None
+            self.selector = SelectPercentile(f_classif, percentile=100)
+        self.classifier = classifier()
+
+    def vectorize(self, features, fit=False):
+        """Turn stemmed descriptions into weighted word features."""
+        if self.transformer is None:
+            if fit:
+                return self.vectorizer.fit_transform(features)
+            return self.vectorizer.transform(features)
+        features = hash_features(self.vectorizer, features, self.processes)
+        if fit:
+            return self.transformer.fit_transform(features)
+        return self.transformer.transform(features)
+
+    def fit(self, features_train, labels_train, sample_weight=None):
+        """Fit model to stemmed descriptions and category names."""
+        features_train = self.vectorize(features_train, fit=True)
+        if self.selector is not None:
+            self.selector.fit(features_train, labels_train)
+            features_train = self.selector.transform(features_train)
+        if self.dense:
+            features_train = features_train.toarray()
+        fit_params = {}
+        if sample_weight is not None:
+            if isinstance(self.classifier, Pipeline):
+                step = self.classifier.steps[-1][0]
+                fit_params[step + "__sample_weight"] = sample_weight
+            else:
+                fit_params["sample_weight"] = sample_weight
+        self.classifier.fit(features_train, labels_train, **fit_params)
+        return self
+
+    def predict(self, features_test):
+        """Predict category names for stemmed descriptions."""
+        if len(features_test) == 0:
+            return []
+        features_test = self.vectorize(features_test)
+        if self.selector is not None:
+            features_test = self.selector.transform(features_test)
+        if self.dense:
+            features_test = features_test.toarray()
+        return self.classifier.predict(features_test)
+
+
+def hash_features(vectorizer, features, processes=1):
+    """Hash stemmed descriptions, in chunks across processes if there are many.
+
+    Hashing is stateless, so chunks can be hashed independently and stacked.
+    """
+    if processes <= 1 or len(features) <= CHUNK_SIZE:
+        return vectorizer.transform(features)
+    chunks = [
+        features[start : start + CHUNK_SIZE]
+        for start in range(0, len(features), CHUNK_SIZE)
+    ]
+    with ProcessPoolExecutor(
+        max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        matrices = list(executor.map(vectorizer.transform, chunks))
+    return sparse.vstack(matrices, format="csr")
+
+
+class OnlineCategoryModel:
+    """Hashed features and a classifier that can learn incrementally.
+
+    The hashing vectorizer is stateless, so learning from a batch of new
+    transactions costs the same however long the group's history is.
+    """
+
+    def __init__(self, classes):
+        """Initialise with the category names that can be predicted."""
+        self.classes = sorted(classes)
+        self.vectorizer = HashingVectorizer(
+            n_features=HASH_FEATURES, alternate_sign=False, stop_words="english"
+        )
+        self.classifier = MultinomialNB(alpha=0.01)
+
+    def fit(self, features_train, labels_train, sample_weight=None):
+        """Fit model to stemmed descriptions and category names in chunks."""
+        for start in range(0, len(features_train), CHUNK_SIZE):
+            end = start + CHUNK_SIZE
+            self.learn(
+                features_train[start:end],
+                labels_train[start:end],
+                None if sample_weight is None else sample_weight[start:end],
+            )
+        return self
+
+    def learn(self, features, labels, sample_weight=None):
+        """Update model with a batch of stemmed descriptions and categories.
+
+        Return False if a category is unknown to the model, in which case
+        the model must be retrained.
+        """
+        if not set(labels) <= set(self.classes):
+            return False
+        features = self.vectorizer.transform(features)
+        self.classifier.partial_fit(
+            features, labels, classes=self.classes, sample_weight=sample_weight
+        )
         return True
-    except ValueError:
+
+    def predict(self, features_test):
+        """Predict category names for stemmed descriptions."""
+        if len(features_test) == 0:
+            return []
+        features_test = self.vectorizer.transform(features_test)
+        return self.classifier.predict(features_test)
+
+
+def get_category_model(group):
+    """Get category model for group, training a new one only if stale.
+
+    Models are cached in this process and stored in the classifiers table
+    so they are shared between workers. A model is stale once the group
+    revision moves on, i.e. when its transactions or categories change.
+    With background training a stale or unconfigured model is queued for
+    training and the latest stored model, if any, is returned in the
+    meantime.
+    """
+    revision = group.revision
+    cached = _model_cache.get(group.group_id)
+    if cached is not None and cached[0] == revision:
+        _model_cache.move_to_end(group.group_id)
+        return cached[1]
+    stored = db.session.get(ClassifierModel, group.group_id)
+    if current_app.config["CLASSIFIER_TRAINING"] == "background":
+        model = get_stored_category_model(stored)
+        # Only a stored model trained with the configured settings is cached
+        cached = _model_cache.get(group.group_id)
+        if cached is None or cached[0] != revision:
+            enqueue_job("train", group.group_id)
+        return model
+    model = None
+    if stored is not None and stored.revision == revision:
+        model = pickle.loads(stored.model)
+    if not is_configured_model(model):
+        model = train_category_model(group)
+        if model is not None:
+            store_category_model(group, revision, model, stored)
+    cache_category_model(group.group_id, revision, model)
+    return model
+
+
+def get_stored_category_model(stored):
+    """Get latest stored category model, whatever revision it is for.
+
+    The stored model is None if the group had nothing to learn from.
+    """
+    if stored is None:
+        return None
+    cached = _model_cache.get(stored.group_id)
+    if cached is not None and cached[0] == stored.revision:
+        return cached[1]
+    model = pickle.loads(stored.model)
+    if model is not None and not is_configured_model(model):
+        return None
+    cache_category_model(stored.group_id, stored.revision, model)
+    return model
+
+
+@job_handler("train")
+def train_category_model_job(job):
+    """Train and store group's category model unless it is up to date.
+
+    If there is nothing to learn, None is stored in its place so that
+    the job is not queued again until the group changes.
+    """
+    group = db.session.get(Group, job.group_id)
+    if group is None:
+        return
+    revision = group.revision
+    stored = db.session.get(ClassifierModel, group.group_id)
+    if (
+        stored is not None
+        and stored.revision == revision
+        and is_configured_model(pickle.loads(stored.model))
+    ):
+        return
+    store_category_model(group, revision, train_category_model(group), stored)
+
+
+def is_configured_model(model):
+    """Is model of the configured mode, algorithm, features and window."""
+    if getattr(model, "window", None) != training_window():
         return False
+    if current_app.config["CLASSIFIER_MODE"] == "online":
+        return isinstance(model, OnlineCategoryModel)
+    return (
+        isinstance(model, CategoryModel)
+        and model.algorithm == current_app.config["CLASSIFIER_ALGORITHM"]
+        and model.features == current_app.config["CLASSIFIER_FEATURES"]
+    )
+
 
+def train_category_model(group):
+    """Train a new category model on group's transactions in training window."""
+    window = training_window()
+    features_train, labels_train, weights = collect_training_data(
+        group.group_id, window
+    )
+    if len(set(labels_train)) < 2:  # Nothing to learn
+        return None
+    if current_app.config["CLASSIFIER_MODE"] == "online":
+        model = OnlineCategoryModel([c.catname for c in group.categories])
+    else:
+        model = CategoryModel(
+            current_app.config["CLASSIFIER_ALGORITHM"],
+            current_app.config["CLASSIFIER_FEATURES"],
+            current_app.config["CLASSIFIER_PROCESSES"],
+        )
+    model.window = window
+    return model.fit(features_train, labels_train, weights)
+
+
+def update_category_model(group, transactions):
+    """Teach group's online category model about newly committed transactions."""
+    learn_category_model(
+        group,
+        [transaction.stemmed_description for transaction in transactions],
+        [transaction.category.catname for transaction in transactions],
+    )
 
-def is_number(s):
-    """Is string a number."""
+
+def learn_category_model(group, features, labels):
+    """Teach group's online category model stemmed descriptions and categories.
+
+    Only applies in online mode and only when the stored model was up to
+    date before the commit, i.e. one revision behind. Otherwise the model
+    is left stale and is retrained in full the next time it is needed.
+    Note that a modified transaction adds evidence for its new category
+    without removing the evidence for its old one, and that new transactions
+    get full weight without older ones decaying until the next retraining.
+    """
+    if current_app.config["CLASSIFIER_MODE"] != "online" or not features:
+        return
+    revision = group.revision
+    stored = db.session.get(ClassifierModel, group.group_id)
+    if stored is None or stored.revision != revision - 1:
+        return
+    cached = _model_cache.get(group.group_id)
+    if cached is not None and cached[0] == stored.revision:
+        model = cached[1]
+    else:
+        model = pickle.loads(stored.model)
+    if not isinstance(model, OnlineCategoryModel):
+        return
+    if not model.learn(features, labels):
+        return
+    store_category_model(group, revision, model, stored)
+    cache_category_model(group.group_id, revision, model)
+
+
+def store_category_model(group, revision, model, stored=None):
+    """Store category model so that other workers can use it."""
+    if stored is None:
+        stored = ClassifierModel(group_id=group.group_id)
+    stored.revision = revision
+    stored.trained = datetime.datetime.now()
+    stored.model = pickle.dumps(model)
+    db.session.add(stored)
     try:
-        float(s)
-        return True
-    except ValueError:
-        return False
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored a model for this group first
+        db.session.rollback()
 
 
-def collect_data():
-    """Get existing transaction descriptions and categories."""
-    feature_data = []
-    label_data = []
-    transactions = current_user.group().transactions
-    for transaction in transactions:
-        description = stem_description(transaction.description)
-        feature_data.append(description)
-        label_data.append(transaction.category.catname)
-    return feature_data, label_data
+def cache_category_model(group_id, revision, model):
+    """Keep category model in this process, evicting least recently used."""
+    _model_cache[group_id] = (revision, model)
+    _model_cache.move_to_end(group_id)
+    while len(_model_cache) > current_app.config["CLASSIFIER_CACHE_SIZE"]:
+        _model_cache.popitem(last=False)
+
 
+def predict_columns(upload):
+    """Predict column labels of uploaded transactions from a sample of rows.
 
-def get_test_features():
-    """Get test features from uploaded transactions."""
-    features_test = []
-    transactions = session["uploaded_transactions"]
-    for transaction in transactions:
-        description = " ".join(transaction)
-        description = stem_description(description)
-        features_test.append(description)
-    return features_test
+    Labels of uploads in structured formats are known, without a header row.
+    """
+    if upload.column_labels is not None:
+        return list(upload.column_labels), False
+    return infer_columns(sample_upload_rows(upload))
 
 
 def collect_data_for_group(group_id):
@@ -141,26 +455,130 @@ def collect_data_for_group(group_id):
     feature_data = []
     label_data = []
     transactions = (
-        db.session.query(Transaction, Category)
+        db.session.query(
+            Transaction.stemmed_description,
+            Transaction.description,
+            Category.catname,
+        )
         .filter(Transaction.group_id == group_id)
         .filter(Transaction.catno == Category.catno)
         .all()
     )
-    for transaction, category in transactions:
-        description = stem_description(transaction.description)
-        feature_data.append(description)
-        label_data.append(category.catname)
+    for stemmed_description, description, catname in transactions:
+        if stemmed_description is None:  # Not yet backfilled
+            stemmed_description = stem_description(description or "")
+        feature_data.append(stemmed_description)
+        label_data.append(catname)
     return feature_data, label_data
 
 
-def stem_description(description):
-    """Stem the transaction description."""
-    translator = str.maketrans("", "", string.punctuation)
-    description = description.translate(translator)  # Remove punctuation
-    stemmer = SnowballStemmer("english")
-    description_list = description.split()
-    stemmed_list = [stemmer.stem(word) for word in description_list]
-    return " ".join(stemmed_list)
+def training_window():
+    """Get the configured training window."""
+    config = current_app.config
+    return TrainingWindow(
+        config["CLASSIFIER_MAX_TRANSACTIONS"],
+        config["CLASSIFIER_MAX_MONTHS"],
+        config["CLASSIFIER_CATEGORY_QUOTA"],
+        config["CLASSIFIER_HALF_LIFE_MONTHS"],
+    )
+
+
+def collect_training_data(group_id, window):
+    """Read group's transactions in training window from database.
+
+    Return stemmed descriptions, category names and sample weights, the
+    weights being None when there is no recency weighting.
+    """
+    return weight_training_rows(read_training_rows(group_id, window), window)
+
+
+def read_training_rows(group_id, window=ALL_TRANSACTIONS, skip=0):
+    """Read stemmed description, category name and date of transactions.
+
+    Rows are most recent first. The window's limits are applied in the
+    query so that only the rows trained on are read. The skip most recent
+    transactions are left out before the window is applied, as they are
+    when the benchmark holds them out for testing.
+    """
+    order = (Transaction.date.desc(), Transaction.transno.desc())
+    in_group = [Transaction.group_id == group_id]
+    if skip:
+        boundary = (
+            db.session.query(Transaction.date, Transaction.transno)
+            .filter(*in_group)
+            .order_by(*order)
+            .offset(skip - 1)
+            .first()
+        )
+        if boundary is None:
+            return []
+        in_group.append(
+            tuple_(Transaction.date, Transaction.transno) < tuple_(*boundary)
+        )
+    query = (
+        db.session.query(
+            Transaction.stemmed_description,
+            Transaction.description,
+            Category.catname,
+            Transaction.date,
+        )
+        .filter(*in_group)
+        .filter(Transaction.catno == Category.catno)
+        .order_by(*order)
+    )
+    cutoff = None
+    if window.max_months:
+        latest = db.session.query(func.max(Transaction.date)).filter(*in_group).scalar()
+        if latest is not None:
+            cutoff = latest - months(window.max_months)
+            query = query.filter(Transaction.date >= cutoff)
+    if window.category_quota:
+        ranked = select(
+            Transaction.transno,
+            func.row_number()
+            .over(partition_by=Transaction.catno, order_by=order)
+            .label("rank"),
+        ).where(*in_group)
+        if cutoff is not None:
+            ranked = ranked.where(Transaction.date >= cutoff)
+        ranked = ranked.subquery()
+        query = query.join(ranked, ranked.c.transno == Transaction.transno).filter(
+            ranked.c.rank <= window.category_quota
+        )
+    if window.max_transactions:
+        query = query.limit(window.max_transactions)
+    return [
+        (
+            stemmed_description or stem_description(description or ""),
+            catname,
+            date,
+        )
+        for stemmed_description, description, catname, date in query
+    ]
+
+
+def weight_training_rows(rows, window):
+    """Get features, labels and recency weights of rows, most recent first.
+
+    The rows are expected to be read in the window by read_training_rows.
+    Weights halve every half life before the most recent transaction, and
+    are None when the window has no half life.
+    """
+    features = [row[0] for row in rows]
+    labels = [row[1] for row in rows]
+    weights = None
+    if window.half_life_months and rows:
+        half_life = months(window.half_life_months).total_seconds()
+        weights = [
+            0.5 ** ((rows[0][2] - date).total_seconds() / half_life)
+            for _, _, date in rows
+        ]
+    return features, labels, weights
+
+
+def months(num_months):
+    """Get the average duration of a number of months."""
+    return datetime.timedelta(days=num_months * DAYS_PER_MONTH)
 
 
 def split_data(feature_data, label_data):
@@ -200,18 +618,6 @@ def feature_selection(features_train, features_test, labels_train):
     return features_train_transformed, features_test_transformed
 
 
-def naive_bayes_predict(features_train, labels_train, features_test):
-    """Naive Bayes."""
-    clf = GaussianNB()
-    # t0 = time()
-    clf.fit(features_train, labels_train)
-    # print("training time:", round(time() - t0, 3), "s")
-    # t0 = time()
-    predict = clf.predict(features_test)
-    # print("predict time:", round(time() - t0, 3), "s")
-    return predict
-
-
 def svm_predict(features_train, labels_train, features_test):
     """SVM algorithm."""
     scaler = preprocessing.StandardScaler().fit(features_train)
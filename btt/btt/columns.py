@@ -0,0 +1,170 @@
+"""Module that infers what the columns of uploaded transactions contain.
+
+Rather than parsing individual cells, a sample of rows spread across the
+file is taken and each column is scored by matching its sampled values,
+joined into one string, against compiled regular expressions.
+"""
+
+import re
+from collections import namedtuple
+
+# Number of rows sampled from uploaded transactions
+SAMPLE_SIZE = 200
+
+# Fraction of a column's values that must match for it to be a date or amount
+MATCH_THRESHOLD = 0.8
+
+DATE_PATTERN = re.compile(
+    r"""
+    ^[ \t]*(?:
+        \d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}                 # 31/12/2020, 12-31-20
+      | \d{4}[/.-]\d{1,2}[/.-]\d{1,2}                   # 2020-12-31
+      | \d{1,2}[ -]?[A-Za-z]{3,9}[ ,-]*\d{2,4}          # 31 Dec 2020, 31-Dec-20
+      | [A-Za-z]{3,9}[ ]+\d{1,2},?[ ]+\d{2,4}           # Dec 31, 2020
+      | (?:19|20)\d{6}                                  # 20201231
+    )(?:[T ]+\d{1,2}:\d{2}(?::\d{2})?)?[ \t]*$          # Optional time
+    """,
+    re.MULTILINE | re.VERBOSE,
+)
+
+AMOUNT_PATTERN = re.compile(
+    r"""
+    ^[ \t]*[-+(]?[ ]*[$€£]?[ ]*[-+]?                    # Sign and currency
+    (?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?                # 1,234.56 or 1234
+    [ ]*\)?[ ]*(?:[CcDd][Rr])?[ \t]*$                   # 12.00 CR, (12.00)
+    """,
+    re.MULTILINE | re.VERBOSE,
+)
+
+LETTERS_PATTERN = re.compile(r"^.*[A-Za-z]{2}.*$", re.MULTILINE)
+
+ColumnScore = namedtuple("ColumnScore", ["filled", "date", "amount", "text", "length"])
+
+
+def infer_columns(transactions, sample_size=SAMPLE_SIZE):
+    """Infer column labels of uploaded transactions.
+
+    Return a label per column, one of date, description, dr, cr, drcr or
+    ignore, and whether the first row is a header row. Column names in a
+    header row take precedence over what is inferred from the values.
+    """
+    num_columns = len(transactions[0])
+    labels, header_row = header_labels(transactions[0])
+    sample = sample_rows(transactions[1:] if header_row else transactions, sample_size)
+    columns = [
+        [row[num] if num < len(row) else "" for row in sample]
+        for num in range(num_columns)
+    ]
+    inferred = label_columns(columns)
+    if not header_row:
+        return inferred, header_row
+    # Fill in whatever the header row did not name
+    missing = {"date", "description", "dr", "cr", "drcr"} - set(labels)
+    if not {"dr", "cr", "drcr"} & set(labels):
+        missing |= {"dr", "cr", "drcr"}
+    else:
+        missing -= {"dr", "cr", "drcr"}
+    for num, label in enumerate(inferred):
+        if labels[num] == "ignore" and label in missing:
+            labels[num] = label
+    return labels, header_row
+
+
+def header_labels(row):
+    """Label columns from column names, if row is a header row."""
+    result = ["ignore" for _ in range(len(row))]
+    header_row = False
+    for i, value in enumerate(row):
+        if "date" in value.lower():
+            result[i] = "date"
+            header_row = True
+        elif "description" in value.lower() or "narration" in value.lower():
+            result[i] = "description"
+            header_row = True
+        elif "dr" in value.lower() and "cr" in value.lower() and len(value) < 6:
+            result[i] = "drcr"
+            header_row = True
+        elif "debit" in value.lower():
+            result[i] = "dr"
+            header_row = True
+        elif "dr" in value.lower() and len(value) < 5:
+            result[i] = "dr"
+            header_row = True
+        elif "credit" in value.lower():
+            result[i] = "cr"
+            header_row = True
+        elif "cr" in value.lower() and len(value) < 5:
+            result[i] = "cr"
+            header_row = True
+    return result, header_row
+
+
+def sample_rows(rows, sample_size):
+    """Take up to sample_size rows spread evenly across rows."""
+    step = max(len(rows) // sample_size, 1)
+    return rows[::step][:sample_size]
+
+
+def score_column(values):
+    """Score how much a column's values look like dates, amounts and text."""
+    values = [value.replace("\n", " ") for value in values if value.strip()]
+    if not values:
+        return ColumnScore(0.0, 0.0, 0.0, 0.0, 0.0)
+    joined = "\n".join(values)
+    count = len(values)
+    return ColumnScore(
+        filled=count,
+        date=len(DATE_PATTERN.findall(joined)) / count,
+        amount=len(AMOUNT_PATTERN.findall(joined)) / count,
+        text=len(LETTERS_PATTERN.findall(joined)) / count,
+        length=len(joined) / count,
+    )
+
+
+def label_columns(columns):
+    """Label sampled columns by scoring their values."""
+    num_rows = max(len(columns[0]), 1) if columns else 1
+    scores = [score_column(values) for values in columns]
+    labels = ["ignore" for _ in columns]
+
+    dates = [num for num, score in enumerate(scores) if score.date >= MATCH_THRESHOLD]
+    if dates:
+        labels[max(dates, key=lambda num: scores[num].date)] = "date"
+
+    amounts = [
+        num
+        for num, score in enumerate(scores)
+        if labels[num] == "ignore" and score.amount >= MATCH_THRESHOLD
+    ]
+    pair = debit_credit_pair(columns, amounts)
+    if pair:
+        labels[pair[0]] = "dr"
+        labels[pair[1]] = "cr"
+    else:
+        # Leftmost full amount column, as balance columns usually come after
+        for num in amounts:
+            if scores[num].filled / num_rows >= 0.9:
+                labels[num] = "drcr"
+                break
+
+    texts = [
+        num
+        for num, score in enumerate(scores)
+        if labels[num] == "ignore" and score.text >= 0.5 and score.length > 3
+    ]
+    if texts:
+        labels[max(texts, key=lambda num: scores[num].length)] = "description"
+    return labels
+
+
+def debit_credit_pair(columns, amounts):
+    """Find two amount columns where nearly every row fills exactly one."""
+    for first_num, first in enumerate(amounts):
+        for second in amounts[first_num + 1 :]:
+            rows = list(zip(columns[first], columns[second]))
+            exclusive = sum(
+                bool(debit.strip()) != bool(credit.strip()) for debit, credit in rows
+            )
+            if rows and exclusive / len(rows) >= 0.9:
+                return first, second
+    return None
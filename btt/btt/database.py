@@ -1,15 +1,24 @@
 """Module that handles the database."""
 
+import hashlib
+from collections import Counter
 import dateutil.parser
 from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event, insert, update
+from sqlalchemy.orm import deferred, validates
 from flask_login import UserMixin
 
 from itsdangerous import BadSignature, Serializer, TimedSerializer
+from .dates import parse_dates
 from .password import hash_password, password_verified
+from .text import merchant_key, normalise_description, stem_description
 
 db = SQLAlchemy()
 
+# Maximum number of fingerprints looked up per query
+DUPLICATE_CHUNK_SIZE = 500
+
 
 class User(UserMixin, db.Model):
     """Class that instantiates a users table."""
@@ -119,6 +128,7 @@ class Group(db.Model):
     __tablename__ = "groups"
     group_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), nullable=False)
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     categories = db.relationship(
         "Category",
         order_by="Category.catname",
@@ -143,6 +153,13 @@ class Group(db.Model):
         back_populates="group",
         cascade="all, delete-orphan",
     )
+    classifier = db.relationship(
+        "ClassifierModel", uselist=False, cascade="all, delete-orphan"
+    )
+    jobs = db.relationship("Job", cascade="all, delete-orphan")
+    uploads = db.relationship("Upload", cascade="all, delete-orphan")
+    upload_batches = db.relationship("UploadBatch", cascade="all, delete-orphan")
+    saved_searches = db.relationship("SavedSearch", cascade="all, delete-orphan")
 
     def add_category(self, catname, cattype):
         """Instance method that adds a user category."""
@@ -218,6 +235,75 @@ class Group(db.Model):
             account=account,
         )
         db.session.add(transaction)
+        return transaction
+
+    def add_transactions(
+        self,
+        transactions,
+        dayfirst=True,
+        yearfirst=False,
+        skip_duplicates=False,
+        batch_size=1000,
+    ):
+        """Instance method that adds many user transactions at once.
+
+        transactions are dicts of the arguments of add_transaction. Names
+        are looked up in dicts, date strings are parsed with a format
+        detected from a sample of them and rows are inserted in batches,
+        bypassing the unit of work. Transactions already in the group are
+        skipped if skip_duplicates. Return the inserted rows of column values.
+        """
+        transactions = list(transactions)
+        catnos = {category.catname: category.catno for category in self.categories}
+        accnos = {account.accname: account.accno for account in self.accounts}
+        dates = parse_dates(
+            (t["date"] for t in transactions if isinstance(t["date"], str)),
+            dayfirst=dayfirst,
+            yearfirst=yearfirst,
+        )
+        rows = []
+        for transaction in transactions:
+            date = transaction["date"]
+            if isinstance(date, str):
+                date = dates[date.strip()]
+                if date is None:
+                    raise ValueError(
+                        "Could not read date {!r}.".format(transaction["date"])
+                    )
+            description = transaction["description"]
+            rows.append(
+                {
+                    "amount": transaction["amount"],
+                    "date": date,
+                    "description": description,
+                    # Set here as validators are bypassed by bulk inserts
+                    "stemmed_description": (
+                        None if description is None else stem_description(description)
+                    ),
+                    "merchant_key": (
+                        None if description is None else merchant_key(description)
+                    ),
+                    "fingerprint": transaction_fingerprint(
+                        date,
+                        transaction["amount"],
+                        description,
+                        accnos[transaction["accname"]],
+                    ),
+                    "catno": catnos[transaction["catname"]],
+                    "accno": accnos[transaction["accname"]],
+                    "group_id": self.group_id,
+                }
+            )
+        if skip_duplicates:
+            duplicates = find_duplicates(
+                self.group_id, [row["fingerprint"] for row in rows]
+            )
+            rows = [row for row, duplicate in zip(rows, duplicates) if not duplicate]
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(insert(Transaction), rows[start : start + batch_size])
+        if rows:
+            self.revision = Group.revision + 1
+        return rows
 
     def __repr__(self):
         """Represent groups as group_id and name."""
@@ -282,18 +368,342 @@ class Transaction(db.Model):
     amount = db.Column(db.Integer, nullable=False)
     date = db.Column(db.DateTime, nullable=False, index=True)
     description = db.Column(db.String(250))
+    stemmed_description = db.Column(db.String(250))
+    merchant_key = db.Column(db.String(250))
+    fingerprint = db.Column(db.String(40))
     catno = db.Column(db.Integer, db.ForeignKey("categories.catno"), nullable=False)
     category = db.relationship(Category, back_populates="transactions")
     accno = db.Column(db.Integer, db.ForeignKey("accounts.accno"), nullable=False)
     account = db.relationship(Account, back_populates="transactions")
     group_id = db.Column(db.Integer, db.ForeignKey("groups.group_id"))
     group = db.relationship(Group, back_populates="transactions")
+    __table_args__ = (
+        db.Index("ix_transactions_group_id_merchant_key", group_id, merchant_key),
+        db.Index("ix_transactions_group_id_fingerprint", group_id, fingerprint),
+        db.Index("ix_transactions_group_id_date", group_id, date, transno),
+    )
+
+    @validates("description")
+    def validate_description(self, key, description):
+        """Keep stemmed description and merchant key in step with description."""
+        if description is None:
+            self.stemmed_description = None
+            self.merchant_key = None
+        else:
+            self.stemmed_description = stem_description(description)
+            self.merchant_key = merchant_key(description)
+        return description
 
     def __repr__(self):
         """Represent transaction as transaction number and group name."""
         return "<Trans:{num},{name}>".format(num=self.transno, name=self.group.name)
 
 
+class ClassifierModel(db.Model):
+    """Class that instantiates a classifiers table.
+
+    Holds the pickled category model trained for a group and the group
+    revision it was trained at, so that all web workers can share it.
+    """
+
+    __tablename__ = "classifiers"
+    group_id = db.Column(db.Integer, db.ForeignKey("groups.group_id"), primary_key=True)
+    revision = db.Column(db.Integer, nullable=False)
+    trained = db.Column(db.DateTime, nullable=False)
+    model = deferred(db.Column(db.LargeBinary, nullable=False))
+
+    def __repr__(self):
+        """Represent classifier as group_id and revision."""
+        return "<Clf:{num},{rev}>".format(num=self.group_id, rev=self.revision)
+
+
+class Job(db.Model):
+    """Class that instantiates a jobs table, the background job queue."""
+
+    __tablename__ = "jobs"
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    group_id = db.Column(db.Integer, db.ForeignKey("groups.group_id"))
+    upload_id = db.Column(db.Integer, db.ForeignKey("uploads.upload_id"))
+    status = db.Column(db.String(64), nullable=False, default="queued", index=True)
+    created = db.Column(db.DateTime, nullable=False)
+    started = db.Column(db.DateTime)
+    finished = db.Column(db.DateTime)
+    error = db.Column(db.Text)
+
+    def __repr__(self):
+        """Represent job as id and kind."""
+        return "<Job:{num},{kind}>".format(num=self.id, kind=self.kind)
+
+
+class SavedSearch(db.Model):
+    """Class that instantiates a saved_searches table.
+
+    Holds the criteria of a search of a group's transactions, so that the
+    session holds just its id and the search is run again for each page.
+    """
+
+    __tablename__ = "saved_searches"
+    search_id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey("groups.group_id"), nullable=False)
+    criteria = db.Column(db.JSON, nullable=False)
+    created = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        """Represent saved search as id and group id."""
+        return "<SavedSearch:{num},{group}>".format(
+            num=self.search_id, group=self.group_id
+        )
+
+
+class UploadBatch(db.Model):
+    """Class that instantiates an upload_batches table.
+
+    Groups the uploads of the statements in an uploaded archive, which are
+    imported without review, a job per statement.
+    """
+
+    __tablename__ = "upload_batches"
+    batch_id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey("groups.group_id"), nullable=False)
+    filename = db.Column(db.String(250))
+    created = db.Column(db.DateTime, nullable=False, index=True)
+    uploads = db.relationship("Upload", order_by="Upload.upload_id")
+
+    def __repr__(self):
+        """Represent upload batch as id and filename."""
+        return "<UploadBatch:{num},{name}>".format(
+            num=self.batch_id, name=self.filename
+        )
+
+
+class Upload(db.Model):
+    """Class that instantiates an uploads table.
+
+    Holds uploaded transactions until they are processed, so that they are
+    not pickled into the session on every request. The uploaded file is
+    held until a job has parsed it, and the job's progress is counted in
+    rows parsed, predicted and inserted. Rows imported without review that
+    cannot be read are counted as skipped. Column labels are known for
+    uploads in structured formats and inferred for CSV uploads.
+    """
+
+    __tablename__ = "uploads"
+    upload_id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey("groups.group_id"), nullable=False)
+    accname = db.Column(db.String(250), nullable=False)
+    filename = db.Column(db.String(250))
+    created = db.Column(db.DateTime, nullable=False, index=True)
+    status = db.Column(db.String(64), nullable=False, default="queued")
+    content = deferred(db.Column(db.LargeBinary))
+    column_labels = db.Column(db.JSON)
+    date_format = db.Column(db.String(8))
+    num_rows = db.Column(db.Integer, nullable=False, default=0)
+    num_predicted = db.Column(db.Integer, nullable=False, default=0)
+    num_kept = db.Column(db.Integer, nullable=False, default=0)
+    num_inserted = db.Column(db.Integer, nullable=False, default=0)
+    num_skipped = db.Column(db.Integer, nullable=False, default=0)
+    batch_id = db.Column(
+        db.Integer, db.ForeignKey("upload_batches.batch_id"), index=True
+    )
+    rows = db.relationship(
+        "UploadRow", cascade="all, delete-orphan", passive_deletes=True
+    )
+
+    def __repr__(self):
+        """Represent upload as id and number of rows."""
+        return "<Upload:{num},{rows}>".format(num=self.upload_id, rows=self.num_rows)
+
+
+class UploadRow(db.Model):
+    """Class that instantiates an upload_rows table, one per uploaded row."""
+
+    __tablename__ = "upload_rows"
+    upload_id = db.Column(
+        db.Integer,
+        db.ForeignKey("uploads.upload_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    rowno = db.Column(db.Integer, primary_key=True)
+    cells = db.Column(db.JSON, nullable=False)
+    catname = db.Column(db.String(250))
+    duplicate = db.Column(db.Boolean, nullable=False, default=False)
+    action = db.Column(db.String(64))
+
+    def __repr__(self):
+        """Represent upload row as upload id and row number."""
+        return "<UploadRow:{num},{row}>".format(num=self.upload_id, row=self.rowno)
+
+
+# Full-text index of transaction descriptions, by dialect. SQLite keeps an
+# FTS5 table in step with triggers, PostgreSQL a GIN expression index.
+DESCRIPTION_INDEX_DDL = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5("
+        "description, content='transactions', content_rowid='transno')",
+        "CREATE TRIGGER IF NOT EXISTS transactions_fts_insert "
+        "AFTER INSERT ON transactions BEGIN "
+        "INSERT INTO transactions_fts(rowid, description) "
+        "VALUES (new.transno, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS transactions_fts_delete "
+        "AFTER DELETE ON transactions BEGIN "
+        "INSERT INTO transactions_fts(transactions_fts, rowid, description) "
+        "VALUES ('delete', old.transno, old.description); END",
+        "CREATE TRIGGER IF NOT EXISTS transactions_fts_update "
+        "AFTER UPDATE OF description ON transactions BEGIN "
+        "INSERT INTO transactions_fts(transactions_fts, rowid, description) "
+        "VALUES ('delete', old.transno, old.description); "
+        "INSERT INTO transactions_fts(rowid, description) "
+        "VALUES (new.transno, new.description); END",
+    ],
+    "postgresql": [
+        "CREATE INDEX IF NOT EXISTS ix_transactions_description_fts "
+        "ON transactions USING gin "
+        "(to_tsvector('simple', coalesce(description, '')))",
+    ],
+}
+
+for dialect, statements in DESCRIPTION_INDEX_DDL.items():
+    for statement in statements:
+        event.listen(
+            Transaction.__table__,
+            "after_create",
+            DDL(statement).execute_if(dialect=dialect),
+        )
+event.listen(
+    Transaction.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS transactions_fts").execute_if(dialect="sqlite"),
+)
+
+
+@event.listens_for(db.session, "before_flush")
+def bump_group_revisions(session, flush_context, instances):
+    """Bump the revision of groups whose transactions or categories change.
+
+    The revision is used to decide when a stored category model is stale.
+    """
+    groups = set()
+    for obj in session.new | session.dirty | session.deleted:
+        if not isinstance(obj, (Transaction, Category)):
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if obj.group is not None:
+            groups.add(obj.group)
+    for group in groups:
+        if group not in session.new and group not in session.deleted:
+            group.revision = Group.revision + 1
+
+
+@event.listens_for(db.session, "before_flush")
+def set_fingerprints(session, flush_context, instances):
+    """Keep fingerprints of new and changed transactions up to date."""
+    for obj in session.new | session.dirty:
+        if not isinstance(obj, Transaction):
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        accno = obj.account.accno if obj.account is not None else obj.accno
+        obj.fingerprint = transaction_fingerprint(
+            obj.date, obj.amount, obj.description, accno
+        )
+
+
+def transaction_fingerprint(date, amount, description, accno):
+    """Fingerprint a transaction to recognise it when it is imported again."""
+    key = "|".join(
+        [
+            date.strftime("%Y-%m-%d"),
+            str(round(amount)),
+            normalise_description(description or ""),
+            str(accno),
+        ]
+    )
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def find_duplicates(group_id, fingerprints):
+    """Flag fingerprints of transactions already in group.
+
+    A fingerprint repeated in fingerprints is flagged only as many times as
+    the group has transactions with it, as the same purchase can be made
+    twice in a day. Return a flag for each fingerprint.
+    """
+    unique_fingerprints = list(set(fingerprints))
+    counts = Counter()
+    for start in range(0, len(unique_fingerprints), DUPLICATE_CHUNK_SIZE):
+        rows = (
+            db.session.query(Transaction.fingerprint, db.func.count())
+            .filter(Transaction.group_id == group_id)
+            .filter(
+                Transaction.fingerprint.in_(
+                    unique_fingerprints[start : start + DUPLICATE_CHUNK_SIZE]
+                )
+            )
+            .group_by(Transaction.fingerprint)
+            .all()
+        )
+        counts.update(dict(rows))
+    flags = []
+    for fingerprint in fingerprints:
+        flags.append(counts[fingerprint] > 0)
+        counts[fingerprint] -= 1
+    return flags
+
+
+def stem_descriptions(batch_size=1000, restem=False):
+    """Store stemmed descriptions, merchant keys and fingerprints.
+
+    Only transactions without a stemmed description, merchant key or
+    fingerprint are updated unless restem is True. Return number of
+    transactions updated.
+    """
+    query = db.session.query(
+        Transaction.transno,
+        Transaction.description,
+        Transaction.date,
+        Transaction.amount,
+        Transaction.accno,
+    )
+    if not restem:
+        query = query.filter(
+            db.or_(
+                Transaction.stemmed_description.is_(None),
+                Transaction.merchant_key.is_(None),
+                Transaction.fingerprint.is_(None),
+            )
+        )
+    count = 0
+    last_transno = 0
+    while True:
+        rows = (
+            query.filter(Transaction.transno > last_transno)
+            .order_by(Transaction.transno)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return count
+        db.session.execute(
+            update(Transaction),
+            [
+                {
+                    "transno": transno,
+                    "stemmed_description": stem_description(description or ""),
+                    "merchant_key": merchant_key(description or ""),
+                    "fingerprint": transaction_fingerprint(
+                        date, amount, description, accno
+                    ),
+                }
+                for transno, description, date, amount, accno in rows
+            ],
+        )
+        db.session.commit()
+        count += len(rows)
+        last_transno = rows[-1].transno
+
+
 def empty_database():
     """Delete existing database tables and recreate empty ones."""
     db.drop_all()  # Drop all existing tables
@@ -0,0 +1,104 @@
+"""Module that parses dates of uploaded transactions.
+
+Rather than parsing every date with dateutil, a strptime format is
+detected once from a sample of a column's dates and applied to the whole
+column, each distinct date string being parsed only once.
+"""
+
+import datetime
+import itertools
+import dateutil.parser
+from .columns import SAMPLE_SIZE, sample_rows
+
+# Field orders of dates, keyed by whether day and year come first
+DATE_ORDERS = {
+    (True, False): "DMY",
+    (False, False): "MDY",
+    (False, True): "YMD",
+    (True, True): "YDM",
+}
+
+# Whether day and year come first, keyed by field order
+DATE_FORMATS = {order: firsts for firsts, order in DATE_ORDERS.items()}
+
+DATE_FIELDS = {"D": ["%d"], "M": ["%m", "%b", "%B"], "Y": ["%Y", "%y"]}
+
+DATE_SEPARATORS = ["/", "-", ".", " ", ""]
+
+TIME_FORMATS = ["", " %H:%M", " %H:%M:%S", "T%H:%M:%S"]
+
+# Formats with punctuation that do not fit an order and separator
+EXTRA_DATE_FORMATS = ["%b %d, %Y", "%B %d, %Y", "%d %b, %Y", "%d %B, %Y"]
+
+
+def parse_dates(values, dayfirst=True, yearfirst=False, sample_size=SAMPLE_SIZE):
+    """Parse date strings, returning a dict of each distinct value's date.
+
+    Values that do not match the detected format are parsed with dateutil,
+    and those it cannot parse either, such as a statement's footer, map to
+    None.
+    """
+    values = list(dict.fromkeys(value.strip() for value in values))
+    date_format = detect_date_format(
+        sample_rows(values, sample_size), dayfirst, yearfirst
+    )
+    dates = {}
+    for value in values:
+        date = None
+        if date_format is not None:
+            try:
+                date = datetime.datetime.strptime(value, date_format)
+            except ValueError:
+                pass
+        if date is None:
+            try:
+                date = dateutil.parser.parse(
+                    value, dayfirst=dayfirst, yearfirst=yearfirst
+                )
+            except Exception:  # Older dateutils raise more than ValueError
+                pass
+        dates[value] = date
+    return dates
+
+
+def detect_date_format(samples, dayfirst=True, yearfirst=False):
+    """Detect the strptime format that parses the sampled date strings.
+
+    Formats in the preferred field order are tried first. If no format
+    parses them all, as when a statement's footer is sampled, the one that
+    parses the most is used. Return None if no format parses any.
+    """
+    samples = [sample for sample in samples if sample]
+    if not samples:
+        return None
+    best_format, best_count = None, 0
+    for date_format in date_formats(dayfirst, yearfirst):
+        count = sum(matches_format(sample, date_format) for sample in samples)
+        if count == len(samples):
+            return date_format
+        if count > best_count:
+            best_format, best_count = date_format, count
+    return best_format
+
+
+def date_formats(dayfirst=True, yearfirst=False):
+    """Generate candidate date formats, those in preferred order first."""
+    preferred = DATE_ORDERS[(dayfirst, yearfirst)]
+    orders = [preferred] + [o for o in DATE_ORDERS.values() if o != preferred]
+    for order in orders:
+        for separator in DATE_SEPARATORS:
+            for fields in itertools.product(*(DATE_FIELDS[field] for field in order)):
+                for time_format in TIME_FORMATS:
+                    yield separator.join(fields) + time_format
+    for date_format in EXTRA_DATE_FORMATS:
+        for time_format in TIME_FORMATS:
+            yield date_format + time_format
+
+
+def matches_format(value, date_format):
+    """Check that value can be parsed with strptime format."""
+    try:
+        datetime.datetime.strptime(value, date_format)
+    except ValueError:
+        return False
+    return True
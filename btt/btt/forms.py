@@ -8,6 +8,7 @@ from wtforms import (
     FloatField,
     SelectMultipleField,
     StringField,
+    TextAreaField,
     FieldList,
     FormField,
     BooleanField,
@@ -68,7 +69,7 @@ class SearchTransactionsForm(FlaskForm):
     end_date = DateTimeLocalField(
         "End Date:", format="%Y-%m-%dT%H:%M", validators=[DataRequired()]
     )
-    description = StringField("Description contains (optional):")
+    description = StringField("Description keywords (optional):")
     category_names_selectall = BooleanField("Select/Unselect All", default=True)
     category_names = MultiCheckboxField("Category Names:")
     category_types_selectall = BooleanField("Select/Unselect All", default=True)
@@ -82,8 +83,16 @@ class SearchTransactionsForm(FlaskForm):
 class UploadTransactionsForm(FlaskForm):
     """Upload transactions form."""
 
-    transactions_file = FileField("File:", validators=[FileRequired()])
+    transactions_file = FileField(
+        "File (CSV, OFX, QFX, QIF or a ZIP of them):", validators=[FileRequired()]
+    )
     account = SelectField("Account:", validators=[DataRequired()])
+    date_format = SelectField(
+        "Date Format:", validators=[DataRequired()], default="DMY"
+    )
+    account_map = TextAreaField(
+        "Accounts of files in a ZIP (one filename pattern = account per line):"
+    )
     upload = SubmitField("Upload")
 
 
@@ -145,6 +154,8 @@ class ProcessUploadedTransactionsForm(FlaskForm):
     row_classifications = FieldList(FormField(ClassifyTransactionRowsForm))
     add = SubmitField("Proceed")
     cancel = SubmitField("Cancel")
+    previous_page = SubmitField("Previous")
+    next_page = SubmitField("Next")
     date_format = SelectField("Date Format:", validators=[DataRequired()])
 
 
@@ -0,0 +1,123 @@
+"""Module that reads transactions from OFX/QFX and QIF files.
+
+Files are read a line at a time and each transaction is yielded as soon as
+it is complete, as a row of date, description and amount. The columns of
+these rows are known, so they need no column inference.
+"""
+
+import html
+import re
+
+# Labels of the columns of rows yielded by importers
+IMPORT_COLUMNS = ["date", "description", "drcr"]
+
+# Importers keyed by file extension
+IMPORTERS = {}
+
+OFX_TAG_PATTERN = re.compile(r"<(/?)([^<>/\s]+)>([^<]*)")
+
+
+def importer(*extensions):
+    """Register decorated function as the importer of files with extensions."""
+
+    def register(function):
+        for extension in extensions:
+            IMPORTERS[extension] = function
+        return function
+
+    return register
+
+
+def get_importer(filename):
+    """Get the importer for filename, or None if it is not a known format."""
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    return IMPORTERS.get(extension)
+
+
+@importer("ofx", "qfx")
+def parse_ofx(lines):
+    """Generate rows of statement transactions in OFX or QFX lines.
+
+    Handles both SGML (version 1) and XML (version 2) files.
+    """
+    transaction = None
+    for closing, tag, text in ofx_tags(lines):
+        tag = tag.upper()
+        if tag == "STMTTRN":
+            if not closing:
+                transaction = {}
+            elif transaction is not None:
+                yield ofx_row(transaction)
+                transaction = None
+        elif transaction is not None and not closing:
+            transaction[tag] = html.unescape(text.strip())
+
+
+def ofx_tags(lines):
+    """Generate (closing, tag, text) of each tag in OFX lines.
+
+    Text runs up to the next tag, which may be on a later line.
+    """
+    buffer = ""
+    for line in lines:
+        buffer += line
+        start = buffer.rfind("<")
+        if start <= 0:
+            continue
+        for match in OFX_TAG_PATTERN.finditer(buffer, 0, start):
+            yield match.group(1) == "/", match.group(2), match.group(3)
+        buffer = buffer[start:]
+    for match in OFX_TAG_PATTERN.finditer(buffer):
+        yield match.group(1) == "/", match.group(2), match.group(3)
+
+
+def ofx_row(transaction):
+    """Get row of date, description and amount of an OFX transaction."""
+    posted = transaction.get("DTPOSTED", "")
+    date = "{}-{}-{}".format(posted[0:4], posted[4:6], posted[6:8])
+    return [
+        date,
+        join_description(transaction.get("NAME"), transaction.get("MEMO")),
+        transaction.get("TRNAMT", "").replace(",", ""),
+    ]
+
+
+@importer("qif")
+def parse_qif(lines):
+    """Generate rows of transactions in QIF lines.
+
+    Records without a date, such as account records, are skipped, as are
+    the split lines of split transactions.
+    """
+    record = {}
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line or line.startswith("!"):  # Blank or header line
+            continue
+        code, value = line[0], line[1:].strip()
+        if code == "^":  # End of record
+            if "D" in record:
+                yield qif_row(record)
+            record = {}
+        elif code not in record:
+            record[code] = value
+
+
+def qif_row(record):
+    """Get row of date, description and amount of a QIF record."""
+    # Quicken writes dates such as 1/ 5'05 and 12/31'2020
+    date = record["D"].replace("'", "/").replace(" ", "")
+    amount = record.get("T", record.get("U", ""))
+    return [
+        date,
+        join_description(record.get("P"), record.get("M")),
+        amount.replace(",", ""),
+    ]
+
+
+def join_description(name, memo):
+    """Join payee name and memo into a description."""
+    parts = [part for part in [name, memo] if part]
+    if len(parts) == 2 and parts[1].startswith(parts[0]):
+        return parts[1]
+    return " ".join(parts)
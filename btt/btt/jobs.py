@@ -0,0 +1,161 @@
+"""Module that runs background jobs in a pool of worker processes.
+
+Jobs are queued in the jobs table so that any web worker can queue them.
+A single "flask worker" process claims queued jobs and runs them in a
+process pool, each worker process having its own app and database engine.
+"""
+
+import datetime
+import multiprocessing
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from flask import current_app
+from .database import db, Job
+
+# Functions that run jobs, keyed by job kind
+JOB_HANDLERS = {}
+
+# Age after which finished jobs are deleted
+JOB_MAX_AGE = datetime.timedelta(days=1)
+
+# App used by jobs in a worker process
+_worker_app = None
+
+
+def job_handler(kind):
+    """Register decorated function as the handler of a kind of job."""
+
+    def register(function):
+        JOB_HANDLERS[kind] = function
+        return function
+
+    return register
+
+
+def enqueue_job(kind, group_id, upload_id=None):
+    """Queue a job unless the same job is already waiting to run.
+
+    Jobs that finished more than JOB_MAX_AGE ago are deleted.
+    """
+    job = Job.query.filter_by(
+        kind=kind, group_id=group_id, upload_id=upload_id, status="queued"
+    ).first()
+    if job is None:
+        delete_finished_jobs()
+        job = Job(
+            kind=kind,
+            group_id=group_id,
+            upload_id=upload_id,
+            created=datetime.datetime.now(),
+        )
+        db.session.add(job)
+        db.session.commit()
+    return job
+
+
+def delete_finished_jobs(max_age=JOB_MAX_AGE):
+    """Delete jobs that finished more than max_age ago, returning how many."""
+    cutoff = datetime.datetime.now() - max_age
+    return Job.query.filter(
+        Job.status.in_(["done", "failed"]), Job.finished < cutoff
+    ).delete(synchronize_session="fetch")
+
+
+def submit_job(kind, group_id, upload_id=None, inline=False):
+    """Queue a job, or run it now in this process if inline."""
+    job = enqueue_job(kind, group_id, upload_id)
+    if inline:
+        claimed = Job.query.filter_by(id=job.id, status="queued").update(
+            {"status": "running", "started": datetime.datetime.now()}
+        )
+        db.session.commit()
+        if claimed:
+            run_job(job.id)
+    return job
+
+
+def claim_job():
+    """Mark the oldest queued job as running and return its id."""
+    while True:
+        job_id = (
+            db.session.query(Job.id)
+            .filter(Job.status == "queued")
+            .order_by(Job.id)
+            .limit(1)
+            .scalar()
+        )
+        if job_id is None:
+            return None
+        claimed = Job.query.filter_by(id=job_id, status="queued").update(
+            {"status": "running", "started": datetime.datetime.now()}
+        )
+        db.session.commit()
+        if claimed:
+            return job_id
+
+
+def run_job(job_id):
+    """Run a claimed job and record whether it succeeded."""
+    job = db.session.get(Job, job_id)
+    try:
+        JOB_HANDLERS[job.kind](job)
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("Job %s failed", job_id)
+        job.status = "failed"
+        job.error = traceback.format_exc()
+    else:
+        job.status = "done"
+    job.finished = datetime.datetime.now()
+    db.session.commit()
+
+
+def init_worker_process(config_name):
+    """Create the app used by jobs in this worker process."""
+    global _worker_app
+    from . import create_app
+
+    _worker_app = create_app(config_name)
+
+
+def run_job_in_worker_process(job_id):
+    """Run a claimed job in a worker process."""
+    with _worker_app.app_context():
+        run_job(job_id)
+
+
+def run_worker(config_name, processes, poll_interval=1.0):
+    """Claim and run queued jobs forever.
+
+    Jobs left running by a previous worker are queued again at startup,
+    so only one worker should be run per database.
+    """
+    Job.query.filter_by(status="running").update({"status": "queued"})
+    db.session.commit()
+    executor = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker_process,
+        initargs=(config_name,),
+        max_tasks_per_child=current_app.config["WORKER_MAX_TASKS_PER_CHILD"],
+    )
+    running = set()
+    with executor:
+        while True:
+            while len(running) < processes:
+                job_id = claim_job()
+                if job_id is None:
+                    break
+                running.add(executor.submit(run_job_in_worker_process, job_id))
+            if running:
+                done, running = wait(
+                    running, timeout=poll_interval, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    if future.exception() is not None:
+                        current_app.logger.error(
+                            "Worker process failed: %s", future.exception()
+                        )
+            else:
+                time.sleep(poll_interval)
@@ -0,0 +1,349 @@
+"""Module that imports uploaded transactions in jobs.
+
+Parsing and predicting an upload, then inserting its reviewed rows, run as
+jobs so that an upload of any size does not tie up a web worker. Jobs run
+in the background worker, or in the request in inline mode. Parsing and
+predicting commit a batch at a time, counting their progress on the upload
+as they go, while rows are inserted in one commit. Jobs can be run again
+after failing or being interrupted. The statements of an uploaded archive
+are imported without review, a job per statement, so the worker's processes
+import them in parallel.
+"""
+
+import csv
+import functools
+import io
+from flask import current_app
+from .database import db, Group, Job, Upload
+from .classification import (
+    categorise_descriptions,
+    learn_category_model,
+    predict_columns,
+)
+from .columns import infer_columns
+from .dates import DATE_FORMATS, parse_dates
+from .importers import IMPORT_COLUMNS, get_importer
+from .jobs import job_handler, submit_job
+from .uploads import (
+    BATCH_SIZE,
+    delete_upload_rows,
+    find_duplicate_rows,
+    kept_upload_rows,
+    review_upload_rows,
+    row_values,
+    stage_rows,
+    update_upload_rows,
+    upload_rows,
+)
+
+
+def start_upload_job(kind, upload):
+    """Start a job of kind on upload, in the background if configured."""
+    inline = current_app.config["IMPORT_PROCESSING"] != "background"
+    return submit_job(kind, upload.group_id, upload.upload_id, inline=inline)
+
+
+def upload_job(kind):
+    """Register decorated function as the handler of a kind of upload job.
+
+    The function is called with the job's upload, unless the upload has
+    been deleted or is done. If it fails the upload is marked as failed.
+    """
+
+    def register(function):
+        @job_handler(kind)
+        @functools.wraps(function)
+        def run(job):
+            upload = db.session.get(Upload, job.upload_id)
+            if upload is None or upload.status == "done":  # Deleted or rerun
+                return
+            try:
+                function(upload)
+            except Exception:
+                db.session.rollback()
+                upload.status = "failed"
+                db.session.commit()
+                raise
+
+        return run
+
+    return register
+
+
+@upload_job("parse_upload")
+def parse_upload(upload):
+    """Parse an uploaded file into rows and predict their categories.
+
+    Rows staged by an interrupted run are replaced, unless they were all
+    staged, in which case only their predictions are made again.
+    """
+    if upload.content is not None:
+        delete_upload_rows(upload)
+        upload.num_rows = 0
+        upload.status = "parsing"
+        db.session.commit()
+        stage_rows(upload, parse_content(upload))
+        upload.content = None
+    upload.num_predicted = 0
+    upload.status = "predicting"
+    db.session.commit()
+    predict_upload(upload)
+    upload.status = "ready"
+    db.session.commit()
+
+
+def parse_content(upload):
+    """Generate rows of upload's file, labelling the columns of known formats."""
+    lines = io.TextIOWrapper(
+        io.BytesIO(upload.content), encoding="utf-8", errors="replace", newline=""
+    )
+    parse = get_importer(upload.filename or "")
+    if parse is None:
+        return csv.reader(lines, delimiter=",")
+    upload.column_labels = IMPORT_COLUMNS
+    return parse(lines)
+
+
+def predict_upload(upload):
+    """Predict column labels of upload and the category and action of its rows.
+
+    Header rows and likely duplicates are to be ignored, other rows kept.
+    There is nothing to predict for an upload without rows.
+    """
+    if upload.num_rows == 0:
+        return
+    group = db.session.get(Group, upload.group_id)
+    labels, header_row = predict_columns(upload)
+    upload.column_labels = labels
+    for start in range(0, upload.num_rows, BATCH_SIZE):
+        rows = upload_rows(upload, start, start + BATCH_SIZE)
+        catnames = categorise_descriptions(group, row_descriptions(rows, labels))
+        duplicates = find_duplicate_rows(
+            group,
+            upload.accname,
+            rows,
+            labels,
+            header_row and start == 0,
+            *DATE_FORMATS[upload.date_format or "DMY"],
+        )
+        predictions = [
+            {
+                "catname": catname,
+                "duplicate": duplicate,
+                "action": "Ignore" if duplicate else "Keep",
+            }
+            for catname, duplicate in zip(catnames, duplicates)
+        ]
+        if start == 0 and header_row:
+            predictions[0].update(catname="Unspecified Expense", action="Ignore")
+        update_upload_rows(upload, start, predictions)
+        upload.num_predicted += len(rows)
+        db.session.commit()
+
+
+def reflag_duplicate_rows(upload):
+    """Flag likely duplicates of upload's rows again, counting rows changed.
+
+    Run when the date format or columns are changed in review. Rows that
+    become likely duplicates are to be ignored and rows that no longer are
+    to be kept, while other rows keep their reviewed action.
+    """
+    group = db.session.get(Group, upload.group_id)
+    dayfirst, yearfirst = DATE_FORMATS[upload.date_format or "DMY"]
+    num_changed = 0
+    for start in range(0, upload.num_rows, BATCH_SIZE):
+        rows = review_upload_rows(upload, start, start + BATCH_SIZE)
+        duplicates = find_duplicate_rows(
+            group,
+            upload.accname,
+            [row.cells for row in rows],
+            upload.column_labels,
+            False,  # A header's date is not read, so it is never flagged
+            dayfirst,
+            yearfirst,
+        )
+        flags = []
+        for row, duplicate in zip(rows, duplicates):
+            action = row.action
+            if duplicate != row.duplicate:
+                action = "Ignore" if duplicate else "Keep"
+                num_changed += 1
+            flags.append({"duplicate": duplicate, "action": action})
+        update_upload_rows(upload, start, flags)
+    return num_changed
+
+
+def row_dates(rows, labels):
+    """Get date strings of uploaded rows that have a cell in the date column."""
+    if not rows:
+        return []
+    column = labels.index("date")
+    return [row[column] for row in rows if column < len(row)]
+
+
+def row_descriptions(rows, labels):
+    """Get descriptions of uploaded rows.
+
+    Use the description column, or the whole row if there is none.
+    """
+    if "description" not in labels:
+        return [" ".join(row) for row in rows]
+    column = labels.index("description")
+    return [row[column] if column < len(row) else "" for row in rows]
+
+
+@upload_job("import_upload")
+def import_upload(upload):
+    """Insert the reviewed rows of an upload that are to be kept.
+
+    The rows are inserted in one commit that also marks the upload done,
+    so a failed or interrupted import inserts nothing and can be run again.
+    The group's model learns them after that commit, which moves the group
+    on by one revision.
+    """
+    upload.status = "importing"
+    db.session.commit()
+    group = db.session.get(Group, upload.group_id)
+    rows = []
+    for cells, catname in kept_upload_rows(upload):
+        row = row_values(cells, upload.column_labels)
+        row["catname"] = catname
+        row["accname"] = upload.accname
+        rows.append(row)
+    dayfirst, yearfirst = DATE_FORMATS[upload.date_format]
+    added_rows = group.add_transactions(
+        rows, dayfirst=dayfirst, yearfirst=yearfirst, batch_size=BATCH_SIZE
+    )
+    upload.num_inserted = len(added_rows)
+    delete_upload_rows(upload)
+    upload.status = "done"
+    db.session.commit()
+    catnames = {category.catno: category.catname for category in group.categories}
+    learn_category_model(
+        group,
+        [row["stemmed_description"] for row in added_rows],
+        [catnames[row["catno"]] for row in added_rows],
+    )
+
+
+@upload_job("import_file")
+def import_file(upload):
+    """Import the new transactions of an uploaded statement without review.
+
+    Rows get their predicted category, likely duplicates and rows whose
+    amount or date cannot be read are skipped, and the statement is
+    inserted in one commit.
+    """
+    upload.status = "importing"
+    db.session.commit()
+    group = db.session.get(Group, upload.group_id)
+    cells = [row for row in parse_content(upload) if "".join(row).strip()]
+    upload.num_rows = len(cells)
+    if cells and upload.column_labels is None:
+        labels, header_row = infer_columns(cells)
+        if header_row:
+            cells = cells[1:]
+        upload.column_labels = labels
+    if cells and not labels_valid(upload.column_labels):
+        raise ValueError("Could not find date, description and amount columns.")
+    dayfirst, yearfirst = DATE_FORMATS[upload.date_format or "DMY"]
+    dates = parse_dates(row_dates(cells, upload.column_labels), dayfirst, yearfirst)
+    rows = []
+    num_skipped = 0
+    for row_cells in cells:
+        try:
+            row = row_values(row_cells, upload.column_labels)
+        except ValueError:  # Such as a closing balance line
+            num_skipped += 1
+            continue
+        row["date"] = dates.get(row["date"].strip())
+        if row["date"] is None:  # Such as a totals line
+            num_skipped += 1
+            continue
+        row["accname"] = upload.accname
+        rows.append(row)
+    catnames = categorise_descriptions(group, [row["description"] for row in rows])
+    for row, catname in zip(rows, catnames):
+        row["catname"] = catname
+    added_rows = group.add_transactions(rows, skip_duplicates=True)
+    upload.num_predicted = upload.num_kept = len(rows)
+    upload.num_skipped = num_skipped
+    upload.num_inserted = len(added_rows)
+    upload.content = None
+    upload.status = "done"
+    db.session.commit()
+    catnames = {category.catno: category.catname for category in group.categories}
+    learn_category_model(
+        group,
+        [row["stemmed_description"] for row in added_rows],
+        [catnames[row["catno"]] for row in added_rows],
+    )
+
+
+def labels_valid(labels):
+    """Check column labels include a date, description and amount."""
+    labels = set(labels)
+    return {"date", "description"} <= labels and (
+        "drcr" in labels or {"dr", "cr"} <= labels
+    )
+
+
+def ready_for_review(upload):
+    """Check upload is ready to review, or to review again after failing.
+
+    An upload that failed can be reviewed again once all its rows were
+    staged and predicted, i.e. if its import failed.
+    """
+    return upload.status == "ready" or (
+        upload.status == "failed" and upload.num_predicted == upload.num_rows
+    )
+
+
+def batch_report(batch):
+    """Report the progress, throughput and any error of each upload in batch."""
+    jobs = {}
+    query = Job.query.filter(
+        Job.upload_id.in_([upload.upload_id for upload in batch.uploads])
+    ).order_by(Job.id)
+    for job in query:
+        jobs[job.upload_id] = job  # Latest job of each upload
+    report = []
+    for upload in batch.uploads:
+        job = jobs.get(upload.upload_id)
+        seconds = None
+        if job is not None and job.started is not None and job.finished is not None:
+            seconds = (job.finished - job.started).total_seconds()
+        failed = job is not None and job.status == "failed"
+        error = None
+        if failed and job.error:
+            error = job.error.strip().splitlines()[-1]
+        report.append(
+            {
+                "filename": upload.filename,
+                "account": upload.accname,
+                "status": "failed" if failed else upload.status,
+                "parsed": upload.num_rows,
+                "inserted": upload.num_inserted,
+                "duplicates": upload.num_kept - upload.num_inserted,
+                "skipped": upload.num_skipped,
+                "seconds": seconds,
+                "rows_per_second": (upload.num_rows / seconds if seconds else None),
+                "error": error,
+            }
+        )
+    return report
+
+
+def upload_progress(upload):
+    """Get the status of upload and counts of its rows processed so far."""
+    job = (
+        Job.query.filter_by(upload_id=upload.upload_id).order_by(Job.id.desc()).first()
+    )
+    failed = job is not None and job.status == "failed"
+    return {
+        "status": "failed" if failed else upload.status,
+        "parsed": upload.num_rows,
+        "predicted": upload.num_predicted,
+        "kept": upload.num_kept,
+        "inserted": upload.num_inserted,
+    }
@@ -0,0 +1,231 @@
+"""Module that builds queries of a group's transactions.
+
+Search criteria are compiled into a single SQL query, used wherever
+transactions are searched or listed, and saved in the database so that
+a search is run again for each page of its results. Descriptions are searched by keyword
+with the database's full-text index of them. Pages are found by keyset
+pagination: each page seeks to the (date, transno) of the last row of the
+page before, using the group's date index, rather than counting past an
+offset. So a page costs the same wherever it is in the group's
+transactions, however many there are.
+"""
+
+import datetime
+import re
+from collections import namedtuple
+from sqlalchemy import (
+    DateTime,
+    column,
+    func,
+    literal,
+    literal_column,
+    select,
+    table,
+    tuple_,
+)
+from sqlalchemy.orm import joinedload
+from .database import db, Account, Category, SavedSearch, Transaction
+
+# Criteria of a search of transactions, each None to not filter by it
+SearchCriteria = namedtuple(
+    "SearchCriteria",
+    [
+        "start_date",
+        "end_date",
+        "category_names",
+        "category_types",
+        "account_names",
+        "description",
+    ],
+    defaults=[None, None, None, None, None, None],
+)
+
+# Saved searches older than this are deleted
+SEARCH_MAX_AGE = datetime.timedelta(days=7)
+
+# SQLite's full-text index of transaction descriptions
+TRANSACTIONS_FTS = table(
+    "transactions_fts", column("rowid"), column("rank"), column("transactions_fts")
+)
+
+KEYWORD_PATTERN = re.compile(r"[^\W_]+")
+
+TransactionPage = namedtuple(
+    "TransactionPage", ["transactions", "previous_cursor", "next_cursor"]
+)
+
+
+def group_transactions(group):
+    """Query group's transactions, loading their category and account."""
+    return Transaction.query.filter(Transaction.group_id == group.group_id).options(
+        joinedload(Transaction.category), joinedload(Transaction.account)
+    )
+
+
+def search_query(group, criteria):
+    """Query group's transactions that match search criteria.
+
+    Categories and accounts are matched by name in subqueries, so that
+    transactions are only filtered on their own indexed columns.
+    """
+    query = group_transactions(group)
+    if criteria.start_date is not None:
+        query = query.filter(Transaction.date >= criteria.start_date)
+    if criteria.end_date is not None:
+        query = query.filter(Transaction.date <= criteria.end_date)
+    if criteria.category_names is not None or criteria.category_types is not None:
+        categories = select(Category.catno).where(Category.group_id == group.group_id)
+        if criteria.category_names is not None:
+            categories = categories.where(Category.catname.in_(criteria.category_names))
+        if criteria.category_types is not None:
+            categories = categories.where(Category.cattype.in_(criteria.category_types))
+        query = query.filter(Transaction.catno.in_(categories))
+    if criteria.account_names is not None:
+        accounts = (
+            select(Account.accno)
+            .where(Account.group_id == group.group_id)
+            .where(Account.accname.in_(criteria.account_names))
+        )
+        query = query.filter(Transaction.accno.in_(accounts))
+    if criteria.description:
+        query = match_description(query, criteria.description)
+    return query
+
+
+def match_description(query, text, ranked=False):
+    """Filter query to transactions with descriptions matching keywords in text.
+
+    Each keyword must start a word of the description, ignoring case. If
+    ranked, the best matches come first.
+    """
+    keywords = KEYWORD_PATTERN.findall(text.lower())
+    if not keywords:
+        return query
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        match = TRANSACTIONS_FTS.c.transactions_fts.op("MATCH")(
+            " AND ".join('"{}"*'.format(keyword) for keyword in keywords)
+        )
+        if not ranked:
+            return query.filter(
+                Transaction.transno.in_(select(TRANSACTIONS_FTS.c.rowid).where(match))
+            )
+        return (
+            query.join(
+                TRANSACTIONS_FTS, TRANSACTIONS_FTS.c.rowid == Transaction.transno
+            )
+            .filter(match)
+            .order_by(TRANSACTIONS_FTS.c.rank)
+        )
+    if dialect == "postgresql":
+        # Must match the expression of the description index
+        vector = func.to_tsvector(
+            literal_column("'simple'"),
+            func.coalesce(Transaction.description, literal_column("''")),
+        )
+        keywords_query = func.to_tsquery(
+            literal_column("'simple'"),
+            " & ".join(keyword + ":*" for keyword in keywords),
+        )
+        query = query.filter(vector.op("@@")(keywords_query))
+        if ranked:
+            query = query.order_by(func.ts_rank(vector, keywords_query).desc())
+        return query
+    for keyword in keywords:  # No full-text index
+        query = query.filter(
+            Transaction.description.icontains(keyword, autoescape=True)
+        )
+    return query
+
+
+def save_search(group, criteria):
+    """Save search criteria of group's transactions, returning the search id.
+
+    Saved searches older than SEARCH_MAX_AGE are deleted.
+    """
+    now = datetime.datetime.now()
+    SavedSearch.query.filter(SavedSearch.created < now - SEARCH_MAX_AGE).delete()
+    values = criteria._asdict()
+    for name in ["start_date", "end_date"]:
+        if values[name] is not None:
+            values[name] = values[name].isoformat()
+    search = SavedSearch(group_id=group.group_id, criteria=values, created=now)
+    db.session.add(search)
+    db.session.commit()
+    return search.search_id
+
+
+def load_search(search_id, group):
+    """Get the criteria of group's saved search, or None if it does not exist."""
+    if search_id is None:
+        return None
+    search = db.session.get(SavedSearch, search_id)
+    if search is None or search.group_id != group.group_id:
+        return None
+    values = dict(search.criteria)
+    for name in ["start_date", "end_date"]:
+        if values[name] is not None:
+            values[name] = datetime.datetime.fromisoformat(values[name])
+    return SearchCriteria(**values)
+
+
+def delete_search(search_id, group):
+    """Delete group's saved search."""
+    SavedSearch.query.filter_by(search_id=search_id, group_id=group.group_id).delete()
+    db.session.commit()
+
+
+def first_transaction_date(group):
+    """Get the date of group's first transaction, or None if it has none."""
+    return (
+        db.session.query(func.min(Transaction.date))
+        .filter(Transaction.group_id == group.group_id)
+        .scalar()
+    )
+
+
+def transaction_page(query, page_size, after=None, before=None, last=False):
+    """Get a page of transactions from query in (date, transno) order.
+
+    The page starts after cursor after or ends before cursor before, else
+    it is the last page if last, else the first page. Cursors of the pages
+    either side are None when there are no more rows that way.
+    """
+    key = tuple_(Transaction.date, Transaction.transno)
+    if before is not None or last:
+        if before is not None:
+            query = query.filter(key < tuple_(*cursor_values(before)))
+        query = query.order_by(Transaction.date.desc(), Transaction.transno.desc())
+        transactions = query.limit(page_size + 1).all()
+        has_previous = len(transactions) > page_size
+        has_next = before is not None
+        transactions = transactions[:page_size][::-1]
+    else:
+        if after is not None:
+            query = query.filter(key > tuple_(*cursor_values(after)))
+        query = query.order_by(Transaction.date, Transaction.transno)
+        transactions = query.limit(page_size + 1).all()
+        has_previous = after is not None
+        has_next = len(transactions) > page_size
+        transactions = transactions[:page_size]
+    if not transactions:
+        return TransactionPage(transactions, None, None)
+    return TransactionPage(
+        transactions,
+        page_cursor(transactions[0]) if has_previous else None,
+        page_cursor(transactions[-1]) if has_next else None,
+    )
+
+
+def page_cursor(transaction):
+    """Get the cursor of a transaction, as used in page URLs."""
+    return "{}_{}".format(transaction.date.isoformat(), transaction.transno)
+
+
+def cursor_values(cursor):
+    """Get (date, transno) from a cursor, raising ValueError if invalid."""
+    date, _, transno = cursor.rpartition("_")
+    return (
+        literal(datetime.datetime.fromisoformat(date), DateTime),
+        int(transno),
+    )
@@ -0,0 +1,60 @@
+"""Module that counts the database queries made by each request.
+
+When QUERY_BUDGET is set, as it is in testing, a request that makes more
+queries than its view's budget raises QueryBudgetExceeded. This catches
+views that lazy load relationships a row at a time, whose queries grow
+with the number of rows rather than staying fixed.
+"""
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request makes more queries than its budget."""
+
+
+def init_app(app):
+    """Check the query counts of app's requests if it has a query budget."""
+    if not app.config["QUERY_BUDGET"]:
+        return
+    if not event.contains(Engine, "before_cursor_execute", count_query):
+        event.listen(Engine, "before_cursor_execute", count_query)
+    app.before_request(start_query_count)
+    app.after_request(check_query_count)
+
+
+def query_budget(budget):
+    """Give decorated view its own budget, for views that run jobs inline."""
+
+    def decorate(view):
+        view.query_budget = budget
+        return view
+
+    return decorate
+
+
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    """Count a query made while a request is being counted."""
+    if has_request_context() and "query_count" in g:
+        g.query_count += 1
+
+
+def start_query_count():
+    """Start counting the queries of a request."""
+    g.query_count = 0
+
+
+def check_query_count(response):
+    """Raise QueryBudgetExceeded if the request made too many queries."""
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, "query_budget", current_app.config["QUERY_BUDGET"])
+    count = g.pop("query_count", 0)
+    if count > budget:
+        raise QueryBudgetExceeded(
+            "{} {} made {} queries, over its budget of {}.".format(
+                request.method, request.path, count, budget
+            )
+        )
+    return response
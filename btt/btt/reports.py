@@ -8,8 +8,8 @@ from flask import session
 from flask_login import current_user
 from .database import db
 from .database import Transaction, Category
-from sqlalchemy.sql import func
-from collections import OrderedDict
+from sqlalchemy.sql import case, func
+from collections import OrderedDict, defaultdict
 from numpy import pi
 import datetime
 
@@ -121,7 +121,6 @@ class ExpensesByCategoryPieGraph(PieGraph):
     def __init__(self, start_date, end_date):
         """Perform database query."""
         super().__init__(start_date, end_date)
-        print(self.start_date, self.end_date)
         self.data = (
             db.session.query(Category.catname, func.sum(Transaction.amount))
             .filter(Transaction.group_id == current_user.group().group_id)
@@ -237,35 +236,16 @@ class AccountBalancesLineGraph(LineGraph):
                 if account.accname == account_name
             ]
 
-        for account in accounts:
-            balance = 0
-            start_balance = 0
-            end_balance = 0
-            transactions = account.transactions
-            balance_data = OrderedDict()
-            for transaction in transactions:
-                if transaction.category.cattype in ["Expense", "Transfer Out"]:
-                    balance -= transaction.amount / 100.0
-                else:
-                    balance += transaction.amount / 100.0
-                if transaction.date < start_date:
-                    start_balance = balance
-                elif transaction.date <= end_date:
-                    end_balance = balance
-                    balance_data[transaction.date] = balance
-
-            if not balance_data:
-                end_balance = start_balance
-
-            balance_data[start_date] = start_balance
-            balance_data.move_to_end(start_date, last=False)
-            now = datetime.datetime.now()
-            if end_date > now:
-                balance_data[now] = end_balance
-            else:
-                balance_data[end_date] = end_balance
+        flows = defaultdict(list)
+        for accno, date, amount in cash_flows(
+            Transaction.accno.in_([account.accno for account in accounts])
+        ):
+            flows[accno].append((date, amount))
 
-            self.data[account.accname] = balance_data
+        for account in accounts:
+            self.data[account.accname] = running_balances(
+                flows[account.accno], start_date, end_date
+            )
 
 
 class CashFlowLineGraph(LineGraph):
@@ -275,34 +255,51 @@ class CashFlowLineGraph(LineGraph):
         """Perform database query and populate data structure."""
         super().__init__(start_date, end_date)
 
-        transactions = current_user.group().transactions
+        flows = [(date, amount) for accno, date, amount in cash_flows()]
+        self.data["Total Cash"] = running_balances(flows, start_date, end_date)
 
-        balance = 0
-        start_balance = 0
-        end_balance = 0
 
-        cash_flow_data = OrderedDict()
+def cash_flows(*criteria):
+    """Get (accno, date, amount) rows of the group's transactions in date order.
 
-        for transaction in transactions:
-            if transaction.category.cattype in ["Expense", "Transfer Out"]:
-                balance -= transaction.amount / 100.0
-            else:
-                balance += transaction.amount / 100.0
-            if transaction.date < start_date:
-                start_balance = balance
-            elif transaction.date <= end_date:
-                end_balance = balance
-                cash_flow_data[transaction.date] = balance
-
-        if not cash_flow_data:
-            end_balance = start_balance
-
-        cash_flow_data[start_date] = start_balance
-        cash_flow_data.move_to_end(start_date, last=False)
-        now = datetime.datetime.now()
-        if end_date > now:
-            cash_flow_data[now] = end_balance
-        else:
-            cash_flow_data[end_date] = end_balance
-
-        self.data["Total Cash"] = cash_flow_data
+    Amounts are signed by category type in the query, so that categories
+    are not loaded a transaction at a time.
+    """
+    amount = case(
+        (Category.cattype.in_(["Expense", "Transfer Out"]), -Transaction.amount),
+        else_=Transaction.amount,
+    )
+    return (
+        db.session.query(Transaction.accno, Transaction.date, amount)
+        .join(Category, Transaction.catno == Category.catno)
+        .filter(Transaction.group_id == current_user.group().group_id, *criteria)
+        .order_by(Transaction.date, Transaction.transno)
+        .all()
+    )
+
+
+def running_balances(flows, start_date, end_date):
+    """Get balances after each of (date, amount) flows between the dates."""
+    balance = 0
+    start_balance = 0
+    end_balance = 0
+    balance_data = OrderedDict()
+    for date, amount in flows:
+        balance += amount / 100.0
+        if date < start_date:
+            start_balance = balance
+        elif date <= end_date:
+            end_balance = balance
+            balance_data[date] = balance
+
+    if not balance_data:
+        end_balance = start_balance
+
+    balance_data[start_date] = start_balance
+    balance_data.move_to_end(start_date, last=False)
+    now = datetime.datetime.now()
+    if end_date > now:
+        balance_data[now] = end_balance
+    else:
+        balance_data[end_date] = end_balance
+    return balance_data
@@ -1,7 +1,9 @@
 """Fixture for pytest."""
 
 import pytest
+from flask import url_for
 from .. import create_app, db
+from ..database import User, Group, MemberShip
 
 
 @pytest.fixture()
@@ -16,3 +18,17 @@ def testing_db():
     db.session.remove()
     db.drop_all()
     app_context.pop()
+
+
+@pytest.fixture()
+def logged_in(testing_db):
+    """Log in a confirmed user whose group has standard categories."""
+    user = User(email="test@example.com", password="kitten", confirmed=True)
+    group = Group(name="Test")
+    group.add_categories_accounts()
+    db.session.add(MemberShip(user=user, group=group, active=True))
+    db.session.commit()
+    testing_db.post(
+        url_for("auth.login"), data={"email": "test@example.com", "password": "kitten"}
+    )
+    yield testing_db
@@ -0,0 +1,323 @@
+"""Classification Tests."""
+
+import datetime
+import pytest
+from flask import current_app
+from sqlalchemy import update
+from .. import db
+from ..database import (
+    Group,
+    Transaction,
+    ClassifierModel,
+    Job,
+    stem_descriptions,
+)
+from ..jobs import claim_job, enqueue_job, run_job
+from ..benchmark import (
+    benchmark_datasets,
+    evaluate_group,
+    evaluate_groups,
+    evaluation_group_ids,
+    run_benchmark,
+    summarise_results,
+)
+from .. import classification
+from ..classification import (
+    ALL_TRANSACTIONS,
+    CategoryModel,
+    TrainingWindow,
+    collect_training_data,
+    hash_features,
+    categorise_descriptions,
+    get_category_model,
+    update_category_model,
+    OnlineCategoryModel,
+    _model_cache,
+)
+
+
+def add_transaction(group, description, catname, day=1, month=1):
+    """Add a transaction to group."""
+    category = [c for c in group.categories if c.catname == catname][0]
+    account = [a for a in group.accounts if a.accname == "Unknown"][0]
+    transaction = Transaction(
+        amount=5000,
+        date=datetime.datetime(2020, month, day),
+        description=description,
+        group=group,
+        category=category,
+        account=account,
+    )
+    db.session.add(transaction)
+    return transaction
+
+
+def make_group():
+    """Make a group with a few categorised transactions."""
+    group = Group(name="Test")
+    group.add_categories_accounts()
+    db.session.add(group)
+    db.session.commit()
+    for day in range(1, 11):
+        add_transaction(group, "WOOLWORTHS SUPERMARKET", "Food and Groceries", day)
+        add_transaction(group, "ORIGIN ENERGY ELECTRICITY", "Utilities", day)
+    db.session.commit()
+    return group
+
+
+def test_category_model_is_stored_and_reused(testing_db):
+    """Test category model is trained once per group revision."""
+    group = make_group()
+    _model_cache.clear()
+    model = get_category_model(group)
+    assert list(model.predict(["woolworth supermarket"])) == ["Food and Groceries"]
+    stored = db.session.get(ClassifierModel, group.group_id)
+    assert stored.revision == group.revision
+    assert get_category_model(group) is model
+    _model_cache.clear()
+    assert get_category_model(group) is not model  # Loaded from database
+
+
+def test_category_model_is_stale_after_change(testing_db):
+    """Test category model is retrained when transactions change."""
+    group = make_group()
+    _model_cache.clear()
+    revision = group.revision
+    model = get_category_model(group)
+    add_transaction(group, "QANTAS AIRWAYS", "Holidays")
+    db.session.commit()
+    assert group.revision == revision + 1
+    assert get_category_model(group) is not model
+
+
+def test_online_category_model_learns_incrementally(testing_db):
+    """Test online category model learns new transactions without a refit."""
+    current_app.config["CLASSIFIER_MODE"] = "online"
+    group = make_group()
+    _model_cache.clear()
+    model = get_category_model(group)
+    assert isinstance(model, OnlineCategoryModel)
+    transaction = add_transaction(group, "QANTAS AIRWAYS", "Holidays")
+    db.session.commit()
+    update_category_model(group, [transaction])
+    assert db.session.get(ClassifierModel, group.group_id).revision == group.revision
+    assert get_category_model(group) is model
+    assert list(model.predict(["qanta airway"])) == ["Holidays"]
+
+
+def test_stemmed_description_is_stored(testing_db):
+    """Test stemmed description is stored and can be backfilled."""
+    group = make_group()
+    transaction = add_transaction(group, "Qantas Airways, Sydney", "Holidays")
+    db.session.commit()
+    assert transaction.stemmed_description == "qanta airway sydney"
+    db.session.execute(update(Transaction).values(stemmed_description=None))
+    db.session.commit()
+    assert stem_descriptions(batch_size=7) == 21
+    assert transaction.stemmed_description == "qanta airway sydney"
+
+
+def test_add_transactions_in_bulk(testing_db):
+    """Test bulk added transactions get derived columns and a new revision."""
+    group = make_group()
+    revision = group.revision
+    rows = group.add_transactions(
+        [
+            {
+                "amount": 1000 + num,
+                "date": datetime.datetime(2020, 2, 1),
+                "description": "Qantas Airways, Sydney {}".format(num),
+                "catname": "Holidays",
+                "accname": "Unknown",
+            }
+            for num in range(5)
+        ],
+        batch_size=2,
+    )
+    db.session.commit()
+    assert len(rows) == 5
+    assert group.revision == revision + 1
+    transactions = Transaction.query.filter_by(catno=rows[0]["catno"]).all()
+    assert [t.amount for t in transactions] == [1000, 1001, 1002, 1003, 1004]
+    assert transactions[0].stemmed_description == "qanta airway sydney 0"
+    assert transactions[0].merchant_key == "qantas airways sydney"
+    rows = group.add_transactions(
+        [
+            {
+                "amount": 1000,
+                "date": datetime.datetime(2020, 2, 1),
+                "description": "QANTAS AIRWAYS SYDNEY 0",
+                "catname": "Holidays",
+                "accname": "Unknown",
+            }
+        ],
+        skip_duplicates=True,
+    )
+    assert rows == []
+
+
+def test_sparse_category_model(testing_db):
+    """Test sparse category model is trained without dense features."""
+    current_app.config["CLASSIFIER_ALGORITHM"] = "complement_nb"
+    group = make_group()
+    _model_cache.clear()
+    model = get_category_model(group)
+    assert not model.dense
+    assert list(model.predict(["origin energi"])) == ["Utilities"]
+
+
+def test_background_category_model_training(testing_db):
+    """Test category model is trained by a queued job in background mode."""
+    current_app.config["CLASSIFIER_TRAINING"] = "background"
+    group = make_group()
+    _model_cache.clear()
+    assert get_category_model(group) is None
+    get_category_model(group)  # Does not queue a second job
+    job_id = claim_job()
+    assert claim_job() is None
+    run_job(job_id)
+    assert db.session.get(Job, job_id).status == "done"
+    model = get_category_model(group)
+    assert list(model.predict(["woolworth"])) == ["Food and Groceries"]
+    add_transaction(group, "QANTAS AIRWAYS", "Holidays")
+    db.session.commit()
+    assert get_category_model(group) is model  # Stale until retrained
+
+
+def test_background_training_is_queued_once_per_revision(testing_db):
+    """Test models of other settings are retrained, untrainable groups once."""
+    current_app.config["CLASSIFIER_TRAINING"] = "background"
+    group = make_group()
+    _model_cache.clear()
+    get_category_model(group)
+    run_job(claim_job())
+    current_app.config["CLASSIFIER_ALGORITHM"] = "complement_nb"
+    _model_cache.clear()
+    assert get_category_model(group) is None  # Trained with another algorithm
+    run_job(claim_job())
+    assert get_category_model(group).algorithm == "complement_nb"
+    small_group = Group(name="Small")
+    small_group.add_categories_accounts()
+    db.session.add(small_group)
+    db.session.commit()
+    assert get_category_model(small_group) is None
+    run_job(claim_job())
+    _model_cache.clear()
+    assert get_category_model(small_group) is None
+    assert claim_job() is None  # Nothing to learn at this revision
+
+
+@pytest.mark.filterwarnings("error::sqlalchemy.exc.SAWarning")
+def test_finished_jobs_are_deleted(testing_db):
+    """Test jobs that finished long ago are deleted when a job is queued."""
+    group = make_group()
+    job = enqueue_job("train", group.group_id)
+    job.status = "done"
+    job.finished = datetime.datetime.now() - datetime.timedelta(days=2)
+    db.session.commit()
+    queued = enqueue_job("train", group.group_id)
+    assert Job.query.all() == [queued]
+
+
+def test_categorise_descriptions_looks_up_merchants(testing_db):
+    """Test repeat merchants get their most recent category."""
+    group = make_group()
+    add_transaction(group, "WOOLWORTHS 0421 SUPERMARKET", "Shopping", day=20)
+    db.session.commit()
+    _model_cache.clear()
+    predict = categorise_descriptions(
+        group, ["Woolworths Supermarket 5521", "ORIGIN ENERGY ELECTRICITY"]
+    )
+    assert predict == ["Shopping", "Utilities"]
+    assert _model_cache == {}  # Model not needed
+
+
+def test_benchmark_cross_validates_generated_data(testing_db):
+    """Test benchmark reports a result per dataset and algorithm."""
+    datasets = benchmark_datasets([100, 200])
+    results = list(run_benchmark(datasets, ["complement_nb", "online"], folds=2))
+    assert [(r["size"], r["algorithm"]) for r in results] == [
+        (100, "complement_nb"),
+        (100, "online"),
+        (200, "complement_nb"),
+        (200, "online"),
+    ]
+    assert all(r["peak_memory"] > 0 for r in results)
+
+
+def test_evaluate_groups_in_parallel(testing_db):
+    """Test groups are evaluated in worker processes and summarised."""
+    group = make_group()
+    small_group = Group(name="Small")
+    small_group.add_categories_accounts()
+    db.session.add(small_group)
+    db.session.commit()
+    add_transaction(small_group, "QANTAS AIRWAYS", "Holidays")
+    db.session.commit()
+    group_ids = evaluation_group_ids()
+    assert group_ids == [group.group_id]
+    results = list(
+        evaluate_groups("testing", group_ids, ["complement_nb"], folds=2, processes=2)
+    )
+    assert [(r["group_id"], r["size"]) for r in results] == [(group.group_id, 20)]
+    summary = summarise_results(results)
+    assert summary[0]["groups"] == 1
+    assert summary[0]["weighted_accuracy"] == results[0]["accuracy"]
+
+
+def test_training_window(testing_db):
+    """Test training is limited to recent transactions, weighted by age."""
+    group = make_group()
+    add_transaction(group, "QANTAS AIRWAYS", "Holidays", month=7)
+    db.session.commit()
+    features, labels, weights = collect_training_data(group.group_id, ALL_TRANSACTIONS)
+    assert len(features) == 21 and weights is None
+    window = TrainingWindow(
+        max_transactions=4, max_months=6, category_quota=2, half_life_months=6
+    )
+    features, labels, weights = collect_training_data(group.group_id, window)
+    assert labels == [
+        "Holidays",
+        "Utilities",
+        "Food and Groceries",
+        "Utilities",
+    ]
+    assert weights[0] == 1.0
+    assert 0.5 < weights[1] < 0.6
+    current_app.config["CLASSIFIER_MAX_TRANSACTIONS"] = 4
+    _model_cache.clear()
+    model = get_category_model(group)
+    assert model.window.max_transactions == 4
+    assert list(model.predict(["qanta airway"])) == ["Holidays"]
+
+
+def test_evaluate_training_window(testing_db):
+    """Test training in window is compared with training on all."""
+    group = make_group()
+    window = TrainingWindow(10, 0, 0, 1)
+    results = evaluate_group(group.group_id, ["multinomial_nb"], window=window)
+    assert [(r["training"], r["train_size"]) for r in results] == [
+        ("all", 16),
+        ("window", 10),
+    ]
+
+
+def test_hashing_category_model(testing_db):
+    """Test hashing features give a fixed size model."""
+    current_app.config["CLASSIFIER_FEATURES"] = "hashing"
+    group = make_group()
+    _model_cache.clear()
+    model = get_category_model(group)
+    assert model.features == "hashing"
+    assert len(model.transformer.idf_) == classification.HASH_FEATURES
+    assert list(model.predict(["origin energi"])) == ["Utilities"]
+
+
+def test_hash_features_in_parallel(monkeypatch):
+    """Test hashing chunks across processes gives the same features."""
+    monkeypatch.setattr(classification, "CHUNK_SIZE", 2)
+    vectorizer = CategoryModel(features="hashing").vectorizer
+    features = ["woolworth", "origin energi", "qanta airway", "salari", "netflix"]
+    serial = hash_features(vectorizer, features)
+    parallel = hash_features(vectorizer, features, processes=2)
+    assert (serial != parallel).nnz == 0
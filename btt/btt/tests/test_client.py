@@ -1,10 +1,634 @@
 """Client Tests."""
 
-from flask import url_for
+import datetime
+import io
+import re
+import zipfile
+import pytest
+from flask import current_app, url_for
+from .. import db
+from ..database import (
+    Account,
+    Category,
+    ClassifierModel,
+    Job,
+    SavedSearch,
+    Transaction,
+    Upload,
+    UploadBatch,
+    User,
+)
+from ..classification import get_category_model
+from ..jobs import claim_job, run_job
+from ..querybudget import QueryBudgetExceeded
+from ..uploads import stage_rows, upload_rows
 from ..views import web
 
+# Column labels of the statements uploaded by the tests
+LABELS = ["date", "description", "drcr"]
+
+
+def upload_file(client, content, filename="statement.csv", **fields):
+    """Upload a statement of content to the Unknown account by default."""
+    data = {
+        "transactions_file": (io.BytesIO(content), filename),
+        "account": "Unknown",
+        "upload": "Upload",
+    }
+    data.update(fields)
+    return client.post(
+        url_for("web.upload_transactions"),
+        data=data,
+        content_type="multipart/form-data",
+    )
+
+
+def review_data(labels, actions, catname="Holidays", button="add"):
+    """Build the review form's data for a page of rows, submitted by button."""
+    data = {"date_format": "DMY", button: "Submit"}
+    for num, label in enumerate(labels):
+        data["col_classifications-{}-column_label".format(num)] = label
+    for num, action in enumerate(actions):
+        data["row_classifications-{}-category_name".format(num)] = catname
+        data["row_classifications-{}-action".format(num)] = action
+    return data
+
 
 def test_home_page(testing_db):
     """Test home page."""
     response = testing_db.get(url_for("web.home_page"))
     assert "Welcome" in response.get_data(as_text=True)
+
+
+def test_categorise_transactions(logged_in):
+    """Test batch categorisation endpoint."""
+    response = logged_in.post(
+        url_for("web.categorise_transactions"),
+        json={"descriptions": ["WOOLWORTHS 1234", "QANTAS"]},
+    )
+    assert response.get_json() == {
+        "categories": ["Unspecified Expense", "Unspecified Expense"]
+    }
+    response = logged_in.post(
+        url_for("web.categorise_transactions"), json={"descriptions": "QANTAS"}
+    )
+    assert response.status_code == 400
+
+
+def test_upload_transactions_are_staged(logged_in):
+    """Test uploaded transactions are staged in the database, not the session."""
+    response = upload_file(
+        logged_in,
+        b"Date,Description,Amount\n"
+        b"01/02/2020,WOOLWORTHS 1234,-12.50\n"
+        b"\n"
+        b"02/02/2020,QANTAS AIRWAYS,-300.00\n",
+    )
+    assert response.status_code == 302
+    with logged_in.session_transaction() as session:
+        upload = db.session.get(Upload, session["upload_id"])
+        assert "uploaded_transactions" not in session
+    assert upload.num_rows == 3
+    assert upload_rows(upload, start=1) == [
+        ["01/02/2020", "WOOLWORTHS 1234", "-12.50"],
+        ["02/02/2020", "QANTAS AIRWAYS", "-300.00"],
+    ]
+    response = logged_in.get(url_for("web.process_transactions"))
+    assert "QANTAS AIRWAYS" in response.get_data(as_text=True)
+
+
+def test_process_uploaded_transactions(logged_in):
+    """Test uploaded transactions are added with the chosen columns."""
+    upload_file(
+        logged_in, b"03/01/2020,WOOLWORTHS 1234,-12.50\n04/01/2020,QANTAS,-300\n"
+    )
+    data = review_data(LABELS, ["Keep", "Keep"])
+    response = logged_in.post(url_for("web.process_transactions"), data=data)
+    assert response.location == url_for("web.upload_progress_page", _external=False)
+    transactions = Transaction.query.order_by(Transaction.date).all()
+    assert [(t.date.day, t.amount, t.description) for t in transactions] == [
+        (3, 1250, "WOOLWORTHS 1234"),
+        (4, 30000, "QANTAS"),
+    ]
+    response = logged_in.get(url_for("web.upload_progress_page"))
+    assert response.location == url_for("web.transactions_page", _external=False)
+    assert Upload.query.count() == 0
+
+
+def test_uploaded_transactions_are_reviewed_a_page_at_a_time(logged_in):
+    """Test each page of the review keeps its decisions on the upload."""
+    current_app.config["REVIEW_PAGE_SIZE"] = 2
+    upload_file(
+        logged_in,
+        b"03/01/2020,WOOLWORTHS 1234,-12.50\n"
+        b"04/01/2020,QANTAS,-300\n"
+        b"05/01/2020,ORIGIN ENERGY,-80\n",
+    )
+    html = logged_in.get(url_for("web.process_transactions")).get_data(as_text=True)
+    assert "QANTAS" in html and "ORIGIN" not in html
+    data = review_data(LABELS, ["Keep", "Ignore"], button="next_page")
+    response = logged_in.post(url_for("web.process_transactions"), data=data)
+    assert response.location == url_for(
+        "web.process_transactions", page=2, _external=False
+    )
+    html = logged_in.get(response.location).get_data(as_text=True)
+    assert "ORIGIN" in html and "QANTAS" not in html
+    data = review_data(LABELS, ["Keep"], catname="Utilities")
+    logged_in.post(url_for("web.process_transactions", page=2), data=data)
+    transactions = Transaction.query.order_by(Transaction.date).all()
+    assert [(t.description, t.category.catname) for t in transactions] == [
+        ("WOOLWORTHS 1234", "Holidays"),
+        ("ORIGIN ENERGY", "Utilities"),
+    ]
+
+
+def test_upload_is_imported_in_background(logged_in):
+    """Test upload jobs are queued in background mode and report progress."""
+    current_app.config["IMPORT_PROCESSING"] = "background"
+    upload_file(
+        logged_in, b"03/01/2020,WOOLWORTHS 1234,-12.50\n04/01/2020,QANTAS,-300\n"
+    )
+    upload = Upload.query.one()
+    status_url = url_for("web.upload_status", upload_id=upload.upload_id)
+    assert logged_in.get(status_url).get_json()["status"] == "queued"
+    html = logged_in.get(url_for("web.upload_progress_page")).get_data(as_text=True)
+    assert "Rows parsed" in html
+    response = logged_in.get(url_for("web.process_transactions"))
+    assert response.location == url_for("web.upload_progress_page", _external=False)
+    run_job(claim_job())
+    assert logged_in.get(status_url).get_json() == {
+        "status": "ready",
+        "parsed": 2,
+        "predicted": 2,
+        "kept": 0,
+        "inserted": 0,
+    }
+    data = review_data(LABELS, ["Keep", "Ignore"])
+    logged_in.post(url_for("web.process_transactions"), data=data)
+    assert Transaction.query.count() == 0
+    run_job(claim_job())
+    assert logged_in.get(status_url).get_json()["inserted"] == 1
+    assert Transaction.query.one().description == "WOOLWORTHS 1234"
+
+
+def test_upload_jobs_can_be_run_again(logged_in):
+    """Test rerun upload jobs neither stage nor insert rows twice."""
+    current_app.config["IMPORT_PROCESSING"] = "background"
+    upload_file(
+        logged_in, b"03/01/2020,WOOLWORTHS 1234,-12.50\n04/01/2020,QANTAS,-300\n"
+    )
+    upload = Upload.query.one()
+    stage_rows(upload, [["03/01/2020", "WOOLWORTHS 1234", "-12.50"]])  # Interrupted
+    job_id = claim_job()
+    run_job(job_id)
+    run_job(job_id)  # As if queued again by a restarted worker
+    assert upload.num_rows == upload.num_predicted == 2
+    assert len(upload_rows(upload)) == 2
+    data = review_data(LABELS, ["Keep", "Keep"])
+    logged_in.post(url_for("web.process_transactions"), data=data)
+    job_id = claim_job()
+    run_job(job_id)
+    run_job(job_id)
+    assert upload.num_inserted == Transaction.query.count() == 2
+
+
+def test_online_model_learns_imported_rows(logged_in):
+    """Test the online model learns an import's rows after its one commit."""
+    current_app.config["CLASSIFIER_MODE"] = "online"
+    group = User.query.first().group()
+    group.add_transactions(
+        [
+            {
+                "amount": 100,
+                "date": datetime.datetime(2020, 1, 1),
+                "description": description,
+                "catname": catname,
+                "accname": "Unknown",
+            }
+            for description, catname in [
+                ("WOOLWORTHS", "Food and Groceries"),
+                ("ORIGIN ENERGY", "Utilities"),
+            ]
+        ]
+    )
+    db.session.commit()
+    get_category_model(group)
+    upload_file(logged_in, b"03/01/2020,QANTAS,-12.50\n04/01/2020,QANTAS AIR,-300\n")
+    data = review_data(LABELS, ["Keep", "Keep"])
+    logged_in.post(url_for("web.process_transactions"), data=data)
+    assert db.session.get(ClassifierModel, group.group_id).revision == group.revision
+    assert list(get_category_model(group).predict(["qanta"])) == ["Holidays"]
+
+
+def test_failed_import_can_be_reviewed_again(logged_in):
+    """Test an import that fails inserts nothing and can be reviewed again."""
+    upload_file(
+        logged_in, b"03/01/2020,WOOLWORTHS 1234,-12.50\n04/01/2020,QANTAS,-3O0\n"
+    )
+    data = review_data(LABELS, ["Keep", "Keep"])
+    logged_in.post(url_for("web.process_transactions"), data=data)
+    assert Upload.query.one().status == "failed"
+    assert Transaction.query.count() == 0
+    html = logged_in.get(url_for("web.upload_progress_page")).get_data(as_text=True)
+    assert "Review Again" in html
+    assert logged_in.get(url_for("web.process_transactions")).status_code == 200
+    data = review_data(LABELS, ["Keep", "Ignore"])
+    logged_in.post(url_for("web.process_transactions"), data=data)
+    assert Transaction.query.one().description == "WOOLWORTHS 1234"
+
+
+def test_empty_upload_is_reported(logged_in):
+    """Test an upload without rows has nothing to review."""
+    upload_file(logged_in, b"\n\n")
+    assert Job.query.one().status == "done"
+    response = logged_in.get(url_for("web.process_transactions"))
+    assert response.location == url_for("web.upload_transactions", _external=False)
+
+
+def test_duplicate_uploaded_transactions_are_ignored(logged_in):
+    """Test rows already imported are marked to be ignored."""
+    group = User.query.first().group()
+    group.add_transactions(
+        [
+            {
+                "amount": 1250,
+                "date": datetime.datetime(2020, 1, 3),
+                "description": "Woolworths  1234",
+                "catname": "Food and Groceries",
+                "accname": "Unknown",
+            }
+        ]
+    )
+    db.session.commit()
+    upload_file(
+        logged_in, b"03/01/2020,WOOLWORTHS 1234,-12.50\n04/01/2020,QANTAS,-300\n"
+    )
+    html = logged_in.get(url_for("web.process_transactions")).get_data(as_text=True)
+    actions = re.findall(r'<option selected value="(Keep|Ignore)"', html)
+    assert actions == ["Ignore", "Keep"]
+
+
+def test_duplicates_are_flagged_again_for_new_date_format(logged_in):
+    """Test changing the date format in review flags duplicates again."""
+    group = User.query.first().group()
+    group.add_transactions(
+        [
+            {
+                "amount": 1250,
+                "date": datetime.datetime(2020, 4, 3),
+                "description": "Woolworths  1234",
+                "catname": "Food and Groceries",
+                "accname": "Unknown",
+            }
+        ]
+    )
+    db.session.commit()
+    upload_file(
+        logged_in, b"04/03/2020,WOOLWORTHS 1234,-12.50\n05/03/2020,QANTAS,-300\n"
+    )
+    html = logged_in.get(url_for("web.process_transactions")).get_data(as_text=True)
+    actions = re.findall(r'<option selected value="(Keep|Ignore)"', html)
+    assert actions == ["Keep", "Keep"]
+    data = review_data(LABELS, ["Keep", "Keep"])
+    data["date_format"] = "MDY"
+    response = logged_in.post(url_for("web.process_transactions"), data=data)
+    assert response.location == url_for(
+        "web.process_transactions", page=1, _external=False
+    )
+    assert Transaction.query.count() == 1
+    html = logged_in.get(response.location).get_data(as_text=True)
+    actions = re.findall(r'<option selected value="(Keep|Ignore)"', html)
+    assert actions == ["Ignore", "Keep"]
+    data = review_data(LABELS, ["Ignore", "Keep"])
+    data["date_format"] = "MDY"
+    logged_in.post(url_for("web.process_transactions"), data=data)
+    transactions = Transaction.query.order_by(Transaction.date).all()
+    assert [(t.date, t.description) for t in transactions] == [
+        (datetime.datetime(2020, 4, 3), "Woolworths  1234"),
+        (datetime.datetime(2020, 5, 3), "QANTAS"),
+    ]
+
+
+def test_duplicates_are_found_above_statement_footer(logged_in):
+    """Test footer rows without a date do not stop duplicates being found."""
+    group = User.query.first().group()
+    group.add_transactions(
+        [
+            {
+                "amount": 1250,
+                "date": datetime.datetime(2020, 1, 3),
+                "description": "Woolworths  1234",
+                "catname": "Food and Groceries",
+                "accname": "Unknown",
+            }
+        ]
+    )
+    db.session.commit()
+    upload_file(
+        logged_in,
+        b"03/01/2020,WOOLWORTHS 1234,-12.50\n04/01/2020,QANTAS,-300\n"
+        b"05/01/2020,COLES 567,-31.20\n06/01/2020,AGL ENERGY,-150\n"
+        b"Total,,-493.70\n",
+    )
+    response = logged_in.get(url_for("web.process_transactions"))
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    actions = re.findall(r'<option selected value="(Keep|Ignore)"', html)
+    assert actions == ["Ignore", "Keep", "Keep", "Keep", "Keep"]
+
+
+def test_upload_ofx_transactions(logged_in):
+    """Test OFX transactions are staged with known columns."""
+    upload_file(
+        logged_in,
+        b"<OFX><STMTTRN><DTPOSTED>20200103<TRNAMT>-12.50<NAME>WOOLWORTHS</STMTTRN>"
+        b"<STMTTRN><DTPOSTED>20200104<TRNAMT>-300<NAME>QANTAS</STMTTRN></OFX>",
+        "statement.ofx",
+    )
+    upload = Upload.query.one()
+    assert upload.column_labels == ["date", "description", "drcr"]
+    assert upload_rows(upload) == [
+        ["2020-01-03", "WOOLWORTHS", "-12.50"],
+        ["2020-01-04", "QANTAS", "-300"],
+    ]
+    response = logged_in.get(url_for("web.process_transactions"))
+    assert "QANTAS" in response.get_data(as_text=True)
+
+
+def test_upload_zip_of_statements(logged_in):
+    """Test each statement in a zip is imported to its mapped account."""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zipped:
+        zipped.writestr(
+            "statements/everyday.csv",
+            "Date,Description,Amount\n03/01/2020,WOOLWORTHS 1234,-12.50\n",
+        )
+        zipped.writestr(
+            "statements/card.ofx",
+            "<OFX><STMTTRN><DTPOSTED>20200104<TRNAMT>-300<NAME>QANTAS</STMTTRN></OFX>",
+        )
+        zipped.writestr("statements/notes.csv", "nothing,to\nsee,here\n")
+    for _ in range(2):
+        response = upload_file(
+            logged_in,
+            archive.getvalue(),
+            "statements.zip",
+            account="Bank A Transaction",
+            date_format="DMY",
+            account_map="*.ofx = Bank B Credit Card\n",
+        )
+        status = logged_in.get(response.location + "status").get_json()
+        assert status["finished"]
+    transactions = Transaction.query.order_by(Transaction.date).all()
+    assert [(t.description, t.account.accname) for t in transactions] == [
+        ("WOOLWORTHS 1234", "Bank A Transaction"),
+        ("QANTAS", "Bank B Credit Card"),
+    ]
+    files = {file["filename"]: file for file in status["files"]}
+    assert files["everyday.csv"]["status"] == "done"
+    assert files["everyday.csv"]["duplicates"] == 1  # Imported the first time
+    assert files["card.ofx"]["parsed"] == 1
+    assert files["notes.csv"]["status"] == "failed"
+    assert files["notes.csv"]["error"].startswith("ValueError")
+    logged_in.get(response.location + "finish")
+    assert Upload.query.count() == 3  # Just the first batch's files remain
+
+
+def test_unreadable_rows_of_zipped_statement_are_skipped(logged_in):
+    """Test rows without a readable date or amount are skipped and counted."""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zipped:
+        zipped.writestr(
+            "everyday.csv",
+            "03/01/2020,WOOLWORTHS 1234,-12.50\n04/01/2020,QANTAS,-300\n"
+            "05/01/2020,COLES 567,-31.20\n31/02/2020,AGL ENERGY,-150\n"
+            "06/01/2020,ORIGIN ENERGY,-8O\n",
+        )
+    response = upload_file(
+        logged_in, archive.getvalue(), "statements.zip", date_format="DMY"
+    )
+    status = logged_in.get(response.location + "status").get_json()
+    assert status["files"][0]["status"] == "done"
+    assert status["files"][0]["inserted"] == 3
+    assert status["files"][0]["skipped"] == 2
+    assert Transaction.query.count() == 3
+
+
+def test_deleted_user_has_no_upload_batches(logged_in):
+    """Test deleting the last user of a group deletes its upload batches."""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zipped:
+        zipped.writestr("everyday.csv", "03/01/2020,WOOLWORTHS 1234,-12.50\n")
+    upload_file(logged_in, archive.getvalue(), "statements.zip", date_format="DMY")
+    assert UploadBatch.query.count() == 1
+    logged_in.post(url_for("auth.delete_user"), data={"yes": "Yes"})
+    assert User.query.count() == 0
+    assert UploadBatch.query.count() == Upload.query.count() == 0
+
+
+def test_transactions_are_listed_a_page_at_a_time(logged_in):
+    """Test transactions are paged through in date order by cursor."""
+    current_app.config["TRANSACTIONS_PAGE_SIZE"] = 2
+    group = User.query.first().group()
+    group.add_transactions(
+        [
+            {
+                "amount": 100 * day,
+                "date": datetime.datetime(2020, 1, day // 2 + 1),
+                "description": "PAYEE {}".format(day),
+                "catname": "Holidays",
+                "accname": "Unknown",
+            }
+            for day in range(5)
+        ]
+    )
+    db.session.commit()
+    payees = re.compile(r"PAYEE \d")
+    html = logged_in.get(url_for("web.transactions_page")).get_data(as_text=True)
+    assert payees.findall(html) == ["PAYEE 0", "PAYEE 1"]
+    next_url = re.search(r'href="([^"]*after=[^"]*)"', html).group(1)
+    html = logged_in.get(next_url.replace("&amp;", "&")).get_data(as_text=True)
+    assert payees.findall(html) == ["PAYEE 2", "PAYEE 3"]
+    previous_url = re.search(r'href="([^"]*before=[^"]*)"', html).group(1)
+    html = logged_in.get(previous_url).get_data(as_text=True)
+    assert payees.findall(html) == ["PAYEE 0", "PAYEE 1"]
+    html = logged_in.get(url_for("web.transactions_page", last=1)).get_data(
+        as_text=True
+    )
+    assert payees.findall(html) == ["PAYEE 3", "PAYEE 4"]
+    assert "after=" not in html
+
+
+def test_search_transactions(logged_in):
+    """Test transactions are searched by date, category, account and text."""
+    group = User.query.first().group()
+    group.add_transactions(
+        [
+            {
+                "amount": 100,
+                "date": datetime.datetime(2020, 1, day),
+                "description": description,
+                "catname": catname,
+                "accname": accname,
+            }
+            for day, description, catname, accname in [
+                (1, "WOOLWORTHS 100%", "Food and Groceries", "Unknown"),
+                (2, "QANTAS", "Holidays", "Unknown"),
+                (3, "Woolworths 1000", "Food and Groceries", "Bank A Transaction"),
+                (4, "WOOLWORTHS 2000", "Food and Groceries", "Unknown"),
+            ]
+        ]
+    )
+    db.session.commit()
+    response = logged_in.post(
+        url_for("web.search_transactions"),
+        data={
+            "start_date": "2020-01-01T00:00",
+            "end_date": "2020-01-03T00:00",
+            "description": "woolworths 10",
+            "category_names": ["Food and Groceries", "Holidays"],
+            "category_types": ["Expense"],
+            "account_names": ["Unknown", "Bank A Transaction"],
+            "search": "Search",
+        },
+    )
+    assert response.location == url_for("web.transactions_page", _external=False)
+    html = logged_in.get(response.location).get_data(as_text=True)
+    assert "WOOLWORTHS 100%" in html and "Woolworths 1000" in html
+    assert "QANTAS" not in html and "WOOLWORTHS 2000" not in html
+    with logged_in.session_transaction() as session:
+        assert "transactions" not in session  # Just the saved search's id
+        assert SavedSearch.query.one().search_id == session["search_id"]
+    logged_in.post(
+        url_for("web.search_transactions"),
+        data={
+            "start_date": "2020-01-01T00:00",
+            "end_date": "2020-01-04T00:00",
+            "description": "100%",
+            "category_names": ["Food and Groceries"],
+            "category_types": ["Expense"],
+            "account_names": ["Unknown"],
+            "search": "Search",
+        },
+    )
+    html = logged_in.get(url_for("web.transactions_page")).get_data(as_text=True)
+    assert "WOOLWORTHS 100%" in html and "Woolworths 1000" not in html
+
+
+def test_deleted_user_has_no_saved_searches(logged_in):
+    """Test deleting the last user of a group deletes its saved searches."""
+    logged_in.post(
+        url_for("web.search_transactions"),
+        data={
+            "start_date": "2020-01-01T00:00",
+            "end_date": "2020-01-31T00:00",
+            "description": "qantas",
+            "search": "Search",
+        },
+    )
+    assert SavedSearch.query.count() == 1
+    logged_in.post(url_for("auth.delete_user"), data={"yes": "Yes"})
+    assert User.query.count() == 0
+    assert SavedSearch.query.count() == 0
+
+
+def test_keyword_search_is_ranked(logged_in):
+    """Test descriptions are searched with the full-text index, best first."""
+    group = User.query.first().group()
+    group.add_transactions(
+        [
+            {
+                "amount": 100,
+                "date": datetime.datetime(2020, 1, 1),
+                "description": description,
+                "catname": "Holidays",
+                "accname": "Unknown",
+            }
+            for description in [
+                "QANTAS AIRWAYS SYDNEY AIRPORT TERMINAL",
+                "Qantas Qantas Club",
+                "VIRGIN AUSTRALIA",
+            ]
+        ]
+    )
+    db.session.commit()
+    transaction = Transaction.query.filter_by(description="VIRGIN AUSTRALIA").one()
+    transaction.description = "VIRGIN QANTAS LINK"
+    db.session.commit()
+    response = logged_in.get(url_for("web.keyword_search", q="qant"))
+    descriptions = [t["description"] for t in response.get_json()["transactions"]]
+    assert descriptions[0] == "Qantas Qantas Club"
+    assert len(descriptions) == 3
+    response = logged_in.get(url_for("web.keyword_search", q="virgin austral"))
+    assert response.get_json()["transactions"] == []
+    db.session.delete(transaction)
+    db.session.commit()
+    response = logged_in.get(url_for("web.keyword_search", q="link"))
+    assert response.get_json()["transactions"] == []
+
+
+def add_transaction_per_category(group):
+    """Add a recent transaction in each of group's categories and accounts."""
+    accounts = group.accounts
+    group.add_transactions(
+        [
+            {
+                "amount": 1000 + num,
+                "date": datetime.datetime.now() - datetime.timedelta(days=num),
+                "description": "PAYEE {}".format(num),
+                "catname": category.catname,
+                "accname": accounts[num % len(accounts)].accname,
+            }
+            for num, category in enumerate(group.categories)
+        ]
+    )
+    db.session.commit()
+    db.session.expire_all()  # So that requests query what they use
+
+
+def test_reports_are_within_query_budget(logged_in):
+    """Test reports do not load each transaction's category or account."""
+    add_transaction_per_category(User.query.first().group())
+    for report_name in [
+        "Expenses by Category",
+        "Income by Category",
+        "Cash Flow",
+        "Account Balances",
+    ]:
+        response = logged_in.get(url_for("web.reports_page", report_name=report_name))
+        assert response.status_code == 200
+
+
+def test_deleted_account_and_category_are_reassigned(logged_in):
+    """Test transactions of a deleted account or category are reassigned."""
+    group = User.query.first().group()
+    add_transaction_per_category(group)
+    account = Account.query.filter_by(accname="Bank A Transaction").one()
+    fingerprints = {t.fingerprint for t in account.transactions}
+    logged_in.post(
+        url_for("web.modify_account", accno=account.accno),
+        data={"account_name": account.accname, "delete": "Delete"},
+    )
+    assert Account.query.filter_by(accname="Bank A Transaction").count() == 0
+    moved = Transaction.query.filter(Transaction.account.has(accname="Unknown"))
+    assert len(fingerprints) == 3
+    assert fingerprints.isdisjoint(t.fingerprint for t in moved)
+    category = Category.query.filter_by(catname="Holidays").one()
+    logged_in.post(
+        url_for("web.modify_category", catno=category.catno),
+        data={
+            "category_name": "Holidays",
+            "category_type": "Expense",
+            "delete": "Delete",
+        },
+    )
+    assert Category.query.filter_by(catname="Holidays").count() == 0
+    transaction = Transaction.query.filter_by(description="PAYEE 6").one()
+    assert transaction.category.catname == "Unspecified Expense"
+
+
+def test_request_over_query_budget_fails(logged_in):
+    """Test a request that makes more queries than the budget raises."""
+    current_app.config["QUERY_BUDGET"] = 1
+    with pytest.raises(QueryBudgetExceeded):
+        logged_in.get(url_for("web.transactions_page"))
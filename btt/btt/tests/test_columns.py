@@ -0,0 +1,35 @@
+"""Column Inference Tests."""
+
+from ..columns import infer_columns
+
+
+def test_infer_columns_without_header():
+    """Test columns are inferred from values when there is no header row."""
+    transactions = [
+        ["03/01/2020", "-45.10", "WOOLWORTHS 1234 SYDNEY", "1,200.55"],
+        ["04/01/2020", "3,000.00", "SALARY ACME PTY LTD", "4,200.55"],
+        ["05/01/2020", "-12.00", "NETFLIX.COM", "4,188.55"],
+    ]
+    assert infer_columns(transactions) == (
+        ["date", "drcr", "description", "ignore"],
+        False,
+    )
+
+
+def test_infer_columns_debit_credit_pair():
+    """Test separate debit and credit columns are found."""
+    transactions = [
+        ["2020-01-03", "WOOLWORTHS 1234 SYDNEY", "45.10", ""],
+        ["2020-01-04", "SALARY ACME PTY LTD", "", "3000.00"],
+        ["2020-01-05", "NETFLIX.COM", "12.00", ""],
+    ]
+    assert infer_columns(transactions) == (["date", "description", "dr", "cr"], False)
+
+
+def test_infer_columns_fills_gaps_in_header():
+    """Test header names take precedence and gaps are inferred."""
+    transactions = [["Date", "Details", "Amount"]] + [
+        ["{}/01/2020".format(day), "COLES {}".format(day), "-9.95"]
+        for day in range(1, 29)
+    ]
+    assert infer_columns(transactions) == (["date", "description", "drcr"], True)
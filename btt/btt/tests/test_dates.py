@@ -0,0 +1,33 @@
+"""Date Parsing Tests."""
+
+import datetime
+from ..dates import detect_date_format, parse_dates
+
+
+def test_detect_date_format():
+    """Test format is detected in preferred order, then in any order."""
+    assert detect_date_format(["03/01/2020", "04/01/2020"]) == "%d/%m/%Y"
+    assert detect_date_format(["03/01/2020"], dayfirst=False) == "%m/%d/%Y"
+    assert detect_date_format(["12/31/2020", "01/02/2021"]) == "%m/%d/%Y"
+    assert detect_date_format(["2020-12-31 10:15:00"]) == "%Y-%m-%d %H:%M:%S"
+    assert detect_date_format(["Dec 31, 2020"]) == "%b %d, %Y"
+    assert detect_date_format(["yesterday"]) is None
+
+
+def test_parse_dates():
+    """Test each distinct date is parsed once with the detected format."""
+    dates = parse_dates(["03/01/2020", " 03/01/2020", "4/1/2020"])
+    assert dates == {
+        "03/01/2020": datetime.datetime(2020, 1, 3),
+        "4/1/2020": datetime.datetime(2020, 1, 4),
+    }
+
+
+def test_unparseable_dates_are_none():
+    """Test dates that cannot be parsed, such as in a footer, map to None."""
+    dates = parse_dates(["03/01/2020", "Total", ""])
+    assert dates == {
+        "03/01/2020": datetime.datetime(2020, 1, 3),
+        "Total": None,
+        "": None,
+    }
@@ -0,0 +1,67 @@
+"""Importer Tests."""
+
+import io
+from ..importers import get_importer, parse_ofx, parse_qif
+
+OFX_SGML = """OFXHEADER:100
+DATA:OFXSGML
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20200103120000[-5:EST]
+<TRNAMT>-1,012.50
+<NAME>WOOLWORTHS
+<MEMO>WOOLWORTHS 1234 SYDNEY
+</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20200104<TRNAMT>300.00<NAME>AT&amp;T</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+OFX_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<OFX>
+  <STMTTRN>
+    <DTPOSTED>20200105</DTPOSTED>
+    <TRNAMT>-5.00</TRNAMT>
+    <NAME>CAFE</NAME>
+  </STMTTRN>
+</OFX>
+"""
+
+QIF = """!Type:Bank
+D1/ 5'20
+T-1,234.56
+PWOOLWORTHS
+MGROCERIES
+^
+D12/31'2020
+U300.00
+PACME PTY LTD
+SSalary
+$300.00
+^
+"""
+
+
+def test_parse_ofx():
+    """Test transactions are read from SGML and XML OFX files."""
+    assert list(parse_ofx(io.StringIO(OFX_SGML))) == [
+        ["2020-01-03", "WOOLWORTHS 1234 SYDNEY", "-1012.50"],
+        ["2020-01-04", "AT&T", "300.00"],
+    ]
+    assert list(parse_ofx(io.StringIO(OFX_XML))) == [["2020-01-05", "CAFE", "-5.00"]]
+
+
+def test_parse_qif():
+    """Test transactions are read from QIF files."""
+    assert list(parse_qif(io.StringIO(QIF))) == [
+        ["1/5/20", "WOOLWORTHS GROCERIES", "-1234.56"],
+        ["12/31/2020", "ACME PTY LTD", "300.00"],
+    ]
+
+
+def test_get_importer():
+    """Test importers are chosen by file extension."""
+    assert get_importer("Statement.QFX") is parse_ofx
+    assert get_importer("statement.qif") is parse_qif
+    assert get_importer("statement.csv") is None
@@ -0,0 +1,43 @@
+"""Module that normalises transaction descriptions."""
+
+import functools
+import string
+from nltk.stem.snowball import SnowballStemmer
+
+STEM_CACHE_SIZE = 65536
+
+translator = str.maketrans("", "", string.punctuation)
+stemmer = SnowballStemmer("english")
+
+
+@functools.lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem_word(word):
+    """Stem a word, remembering recently stemmed words."""
+    return stemmer.stem(word)
+
+
+def stem_description(description):
+    """Stem the transaction description."""
+    description = description.translate(translator)  # Remove punctuation
+    # Numbers are left as they are rather than filling the stem cache
+    stemmed_list = [
+        word if word.isdigit() else stem_word(word) for word in description.split()
+    ]
+    return " ".join(stemmed_list)
+
+
+def normalise_description(description):
+    """Normalise case, punctuation and spacing of description."""
+    return " ".join(description.translate(translator).lower().split())
+
+
+def merchant_key(description):
+    """Normalise description to a key shared by repeat transactions.
+
+    Words containing digits, such as card numbers, receipt numbers and
+    dates, are dropped so that monthly transactions from the same
+    merchant or biller get the same key.
+    """
+    description = description.translate(translator).lower()
+    words = [word for word in description.split() if word.isalpha()]
+    return " ".join(words)[:250]
@@ -0,0 +1,337 @@
+"""Module that stages uploaded transactions in the database.
+
+Uploaded rows are streamed into the upload_rows table in batches and read
+back only as needed, the session holding just the upload id. Each row
+also holds its category and what to do with it, predicted when the upload
+is parsed and then updated a page at a time as the rows are reviewed.
+"""
+
+import datetime
+import fnmatch
+import io
+import os
+import zipfile
+from sqlalchemy import delete, func, insert, select, update
+from .columns import SAMPLE_SIZE
+from .database import (
+    db,
+    Job,
+    Upload,
+    UploadBatch,
+    UploadRow,
+    find_duplicates,
+    transaction_fingerprint,
+)
+from .dates import parse_dates
+
+# Number of rows inserted or read at once
+BATCH_SIZE = 1000
+
+# Uploads not processed within this time are deleted
+UPLOAD_MAX_AGE = datetime.timedelta(days=1)
+
+# Largest total size of the files in an uploaded archive
+ARCHIVE_MAX_SIZE = 100 * 2**20
+
+
+def create_upload(group, accname, filename, content, date_format=None):
+    """Store an uploaded file to be parsed by a job and return the upload."""
+    upload = Upload(
+        group_id=group.group_id,
+        accname=accname,
+        filename=filename,
+        created=datetime.datetime.now(),
+        content=content,
+        date_format=date_format,
+    )
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+
+def create_upload_batch(group, filename, statements, date_format=None):
+    """Store the statements of an uploaded archive as a batch of uploads.
+
+    statements are (filename, account name, content) of each statement.
+    """
+    now = datetime.datetime.now()
+    batch = UploadBatch(group_id=group.group_id, filename=filename, created=now)
+    db.session.add(batch)
+    for statement_name, accname, content in statements:
+        batch.uploads.append(
+            Upload(
+                group_id=group.group_id,
+                accname=accname,
+                filename=statement_name,
+                created=now,
+                content=content,
+                date_format=date_format,
+            )
+        )
+    db.session.commit()
+    return batch
+
+
+def read_archive(archive, max_size=ARCHIVE_MAX_SIZE):
+    """Read (filename, content) of the files in a zip archive.
+
+    Directories and hidden files, such as macOS metadata, are skipped.
+    """
+    with zipfile.ZipFile(io.BytesIO(archive)) as zipped:
+        members = [
+            member
+            for member in zipped.infolist()
+            if not member.is_dir()
+            and not member.filename.startswith("__MACOSX/")
+            and not os.path.basename(member.filename).startswith(".")
+        ]
+        if sum(member.file_size for member in members) > max_size:
+            raise ValueError("Archive is too large.")
+        return [
+            (os.path.basename(member.filename), zipped.read(member))
+            for member in members
+        ]
+
+
+def parse_account_map(text):
+    """Parse lines of "pattern = account" into (pattern, account) pairs.
+
+    Patterns are shell style wildcards matched against statement filenames.
+    """
+    account_map = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        pattern, separator, accname = line.partition("=")
+        if not separator or not pattern.strip() or not accname.strip():
+            raise ValueError("Invalid account mapping: {}".format(line.strip()))
+        account_map.append((pattern.strip(), accname.strip()))
+    return account_map
+
+
+def map_account(filename, account_map, default):
+    """Get the account of the first pattern matching filename, else default."""
+    for pattern, accname in account_map:
+        if fnmatch.fnmatch(filename.lower(), pattern.lower()):
+            return accname
+    return default
+
+
+def stage_rows(upload, rows):
+    """Store non blank rows of uploaded transactions, a batch at a time."""
+    batch = []
+    for row in rows:
+        if not "".join(row).strip():  # Skip blank lines
+            continue
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            add_upload_rows(upload, batch)
+            batch = []
+    if batch:
+        add_upload_rows(upload, batch)
+
+
+def add_upload_rows(upload, rows):
+    """Append rows to upload, committing them so progress can be seen."""
+    db.session.execute(
+        insert(UploadRow),
+        [
+            {
+                "upload_id": upload.upload_id,
+                "rowno": upload.num_rows + num,
+                "cells": row,
+            }
+            for num, row in enumerate(rows)
+        ],
+    )
+    upload.num_rows += len(rows)
+    db.session.commit()
+
+
+def update_upload_rows(upload, start, values):
+    """Update columns of upload's rows from row number start.
+
+    values is a dict of column values for each row.
+    """
+    db.session.execute(
+        update(UploadRow),
+        [
+            dict(value, upload_id=upload.upload_id, rowno=start + num)
+            for num, value in enumerate(values)
+        ],
+    )
+
+
+def get_upload(upload_id, group):
+    """Get group's upload, or None if it does not exist."""
+    if upload_id is None:
+        return None
+    upload = db.session.get(Upload, upload_id)
+    if upload is None or upload.group_id != group.group_id:
+        return None
+    return upload
+
+
+def upload_rows(upload, start=0, stop=None):
+    """Read upload's rows in order, from row number start up to stop."""
+    query = (
+        db.session.query(UploadRow.cells)
+        .filter(UploadRow.upload_id == upload.upload_id)
+        .filter(UploadRow.rowno >= start)
+        .order_by(UploadRow.rowno)
+    )
+    if stop is not None:
+        query = query.filter(UploadRow.rowno < stop)
+    return [cells for cells, in query.yield_per(BATCH_SIZE)]
+
+
+def review_upload_rows(upload, start, stop):
+    """Read cells, category, action and duplicate flag of upload's rows.
+
+    Rows are read from row number start up to stop.
+    """
+    query = (
+        db.session.query(
+            UploadRow.cells, UploadRow.catname, UploadRow.action, UploadRow.duplicate
+        )
+        .filter(UploadRow.upload_id == upload.upload_id)
+        .filter(UploadRow.rowno >= start, UploadRow.rowno < stop)
+        .order_by(UploadRow.rowno)
+    )
+    return query.all()
+
+
+def count_kept_rows(upload):
+    """Count upload's rows to be kept."""
+    return (
+        db.session.query(func.count(UploadRow.rowno))
+        .filter(UploadRow.upload_id == upload.upload_id)
+        .filter(UploadRow.action == "Keep")
+        .scalar()
+    )
+
+
+def kept_upload_rows(upload, start=0, stop=None):
+    """Read cells and category of upload's rows to be kept, in order."""
+    query = (
+        db.session.query(UploadRow.cells, UploadRow.catname)
+        .filter(UploadRow.upload_id == upload.upload_id)
+        .filter(UploadRow.action == "Keep")
+        .filter(UploadRow.rowno >= start)
+        .order_by(UploadRow.rowno)
+    )
+    if stop is not None:
+        query = query.filter(UploadRow.rowno < stop)
+    return query.all()
+
+
+def sample_upload_rows(upload, sample_size=SAMPLE_SIZE):
+    """Read upload's first row and up to sample_size rows spread over the rest."""
+    step = max((upload.num_rows - 1) // sample_size, 1)
+    query = (
+        db.session.query(UploadRow.cells)
+        .filter(UploadRow.upload_id == upload.upload_id)
+        .filter(db.or_(UploadRow.rowno == 0, (UploadRow.rowno - 1) % step == 0))
+        .order_by(UploadRow.rowno)
+        .limit(sample_size + 1)
+    )
+    return [cells for cells, in query]
+
+
+def delete_upload_rows(upload):
+    """Delete upload's rows once they are no longer needed."""
+    db.session.execute(delete(UploadRow).where(UploadRow.upload_id == upload.upload_id))
+
+
+def delete_upload(upload):
+    """Delete upload and its rows."""
+    delete_upload_rows(upload)
+    db.session.execute(
+        update(Job).where(Job.upload_id == upload.upload_id).values(upload_id=None)
+    )
+    db.session.delete(upload)
+    db.session.commit()
+
+
+def delete_upload_batch(batch):
+    """Delete batch and the uploads of its statements."""
+    delete_uploads(Upload.batch_id == batch.batch_id)
+    db.session.delete(batch)
+    db.session.commit()
+
+
+def delete_stale_uploads(max_age=UPLOAD_MAX_AGE):
+    """Delete uploads and batches never finished with, returning how many."""
+    cutoff = datetime.datetime.now() - max_age
+    count = delete_uploads(Upload.created < cutoff)
+    emptied = (
+        ~select(Upload.upload_id)
+        .where(Upload.batch_id == UploadBatch.batch_id)
+        .exists()
+    )
+    db.session.execute(
+        delete(UploadBatch).where(UploadBatch.created < cutoff).where(emptied)
+    )
+    db.session.commit()
+    return count
+
+
+def delete_uploads(condition):
+    """Delete uploads matching condition and their rows, returning how many."""
+    upload_ids = select(Upload.upload_id).where(condition)
+    db.session.execute(delete(UploadRow).where(UploadRow.upload_id.in_(upload_ids)))
+    db.session.execute(
+        update(Job).where(Job.upload_id.in_(upload_ids)).values(upload_id=None)
+    )
+    return db.session.execute(delete(Upload).where(condition)).rowcount
+
+
+def row_values(cells, labels):
+    """Get amount, date and description of an uploaded row from column labels."""
+    values = {"amount": 0, "date": "", "description": ""}
+    for cell, label in zip(cells, labels):
+        if cell is None or not cell or cell.isspace():
+            continue
+        if label == "date":
+            values["date"] = cell
+        elif label == "description":
+            values["description"] = cell
+        elif label in ["dr", "cr", "drcr"]:
+            values["amount"] = abs(float(cell) * 100)
+    return values
+
+
+def find_duplicate_rows(
+    group, accname, rows, labels, header_row, dayfirst=True, yearfirst=False
+):
+    """Flag uploaded rows that are likely already in group's transactions.
+
+    Rows that cannot be read with the column labels, or whose date cannot
+    be parsed, are not flagged.
+    """
+    account = [a for a in group.accounts if a.accname == accname][0]
+    values = {}
+    for rowno, cells in enumerate(rows):
+        if rowno == 0 and header_row:
+            continue
+        try:
+            values[rowno] = row_values(cells, labels)
+        except ValueError:
+            continue
+    dates = parse_dates(
+        (value["date"] for value in values.values()), dayfirst, yearfirst
+    )
+    fingerprints = {
+        rowno: transaction_fingerprint(
+            dates[value["date"].strip()],
+            value["amount"],
+            value["description"],
+            account.accno,
+        )
+        for rowno, value in values.items()
+        if dates[value["date"].strip()] is not None
+    }
+    duplicates = dict(
+        zip(fingerprints, find_duplicates(group.group_id, list(fingerprints.values())))
+    )
+    return [duplicates.get(rowno, False) for rowno in range(len(rows))]
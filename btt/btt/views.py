@@ -8,10 +8,12 @@ from flask import (
     Blueprint,
     flash,
     request,
+    jsonify,
+    current_app,
 )
 from flask_login import login_required, current_user
 from sqlalchemy.orm.exc import NoResultFound
-from .database import Transaction, Account, Category
+from .database import Transaction, Account, Category, UploadBatch
 from .forms import (
     ModifyTransactionForm,
     AddTransactionForm,
@@ -26,18 +28,56 @@ from .forms import (
     ClassifyTransactionRowsForm,
     ReportForm,
 )
-from .classification import predict_categories, predict_columns
+from .classification import categorise_descriptions, update_category_model
 from werkzeug.utils import secure_filename
 from .database import db
 from .reports import graph
-from tempfile import mkdtemp
+from .processing import (
+    batch_report,
+    ready_for_review,
+    reflag_duplicate_rows,
+    start_upload_job,
+    upload_progress,
+)
+from .querybudget import query_budget
+from .queries import (
+    SearchCriteria,
+    delete_search,
+    first_transaction_date,
+    group_transactions,
+    load_search,
+    match_description,
+    save_search,
+    search_query,
+    transaction_page,
+)
+from .uploads import (
+    count_kept_rows,
+    create_upload,
+    create_upload_batch,
+    delete_stale_uploads,
+    delete_upload,
+    delete_upload_batch,
+    get_upload,
+    map_account,
+    parse_account_map,
+    read_archive,
+    review_upload_rows,
+    update_upload_rows,
+)
 import datetime
-import csv
-import os
+import zipfile
 
 
 web = Blueprint("web", __name__)
 
+DATE_FORMAT_CHOICES = [
+    ("DMY", "DD/MM/YY"),
+    ("MDY", "MM/DD/YY"),
+    ("YMD", "YY/MM/DD"),
+    ("YDM", "YY/DD/MM"),
+]
+
 
 @web.route("/")
 @web.route("/home")
@@ -92,14 +132,14 @@ def modify_account(accno):
             db.session.add(account)
             db.session.commit()
         elif form.delete.data:
-            for transaction in current_user.group().transactions:
-                if transaction.account == account:
-                    unknown_account = Account.query.filter_by(
-                        group=current_user.group(), accname="Unknown"
-                    ).one()
-                    transaction.account = unknown_account
-                    db.session.add(transaction)
-                    db.session.commit()
+            unknown_account = Account.query.filter_by(
+                group=group, accname="Unknown"
+            ).one()
+            # Reassigned in one flush, which also updates their fingerprints
+            for transaction in Transaction.query.filter_by(
+                group=group, account=account
+            ):
+                transaction.account = unknown_account
             db.session.delete(account)
             db.session.commit()
         return redirect(url_for(".accounts_page"))
@@ -146,15 +186,25 @@ def add_account():
 @web.route("/transactions")
 @login_required
 def transactions_page():
-    """Return Transactions HTML page."""
-    transaction_numbers = session.get("transactions", (-1,))
-    transactions = [
-        transaction
-        for transaction in current_user.group().transactions
-        if transaction.transno in transaction_numbers
-    ]
+    """Return a page of Transactions HTML page."""
+    query = search_query(current_user.group(), current_search())
+    try:
+        page = transaction_page(
+            query,
+            current_app.config["TRANSACTIONS_PAGE_SIZE"],
+            after=request.args.get("after"),
+            before=request.args.get("before"),
+            last="last" in request.args,
+        )
+    except ValueError:
+        flash("Invalid page.")
+        return redirect(url_for(".transactions_page"))
     return render_template(
-        "transactions.html", transactions=transactions, menu="transactions"
+        "transactions.html",
+        transactions=page.transactions,
+        previous_cursor=page.previous_cursor,
+        next_cursor=page.next_cursor,
+        menu="transactions",
     )
 
 
@@ -173,8 +223,6 @@ def delete_transaction(transno):
     db.session.delete(transaction_to_delete)
     db.session.commit()
     flash("Transaction deleted.")
-    if transno in session.get("transactions", (-1,)):
-        session["transactions"].remove(transno)
     return redirect(url_for(".transactions_page"))
 
 
@@ -194,10 +242,8 @@ def search_transactions():
     form = SearchTransactionsForm()
 
     # Form choices and defaults
-    if current_user.group().transactions:
-        form.start_date.default = current_user.group().transactions[0].date
-    else:
-        form.start_date.default = datetime.datetime.now()
+    first_date = first_transaction_date(current_user.group())
+    form.start_date.default = first_date or datetime.datetime.now()
     form.end_date.default = datetime.datetime.now()
     form.category_names.choices = [
         (category.catname, category.catname) for category in categories
@@ -216,35 +262,17 @@ def search_transactions():
         # This must go here or else before_app_request will try to commit
         # transaction with NULL fields when SQLALCHEMY_COMMIT_ON_TEARDOWN
         # is set to True
+        clear_search()
         if form.search.data:
-            start_date = form.start_date.data
-            end_date = form.end_date.data
-            category_names = form.category_names.data
-            category_types = form.category_types.data
-            account_names = form.account_names.data
-            description = form.description.data
-            if description:
-                description = description.lower()
-            transactions = current_user.group().transactions
-            selected_transactions = []
-            for transaction in transactions:
-                trans_description = transaction.description.lower()
-                if description and description not in trans_description:
-                    continue
-                if (
-                    transaction.date >= start_date
-                    and transaction.date <= end_date
-                    and transaction.category.catname in category_names
-                    and transaction.category.cattype in category_types
-                    and transaction.account.accname in account_names
-                ):
-                    selected_transactions.append(transaction)
-        elif form.cancel.data:
-            selected_transactions = current_user.group().transactions
-
-        session["transactions"] = [
-            transaction.transno for transaction in selected_transactions
-        ]
+            criteria = SearchCriteria(
+                start_date=form.start_date.data,
+                end_date=form.end_date.data,
+                category_names=form.category_names.data,
+                category_types=form.category_types.data,
+                account_names=form.account_names.data,
+                description=form.description.data,
+            )
+            session["search_id"] = save_search(current_user.group(), criteria)
 
         return redirect(url_for(".transactions_page"))
 
@@ -253,6 +281,35 @@ def search_transactions():
     return render_template("search_transactions.html", form=form, menu="transactions")
 
 
+@web.route("/transactions/keywords")
+@login_required
+def keyword_search():
+    """
+    Search transaction descriptions by keyword.
+
+    Returns JSON {"transactions": [...]} with up to limit transactions
+    whose descriptions match the keywords in q, best matches first.
+    """
+    text = request.args.get("q", "")
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    query = match_description(
+        group_transactions(current_user.group()), text, ranked=True
+    )
+    return jsonify(
+        transactions=[
+            {
+                "transno": transaction.transno,
+                "date": transaction.date.isoformat(),
+                "description": transaction.description,
+                "amount": transaction.amount / 100,
+                "category": transaction.category.catname,
+                "account": transaction.account.accname,
+            }
+            for transaction in query.limit(limit if text.strip() else 0)
+        ]
+    )
+
+
 @web.route("/transactions/add", methods=["GET", "POST"])
 @login_required
 def add_transaction():
@@ -295,14 +352,10 @@ def add_transaction():
             transaction.description = form.description.data
             db.session.add(transaction)
             db.session.commit()
+            update_category_model(current_user.group(), [transaction])
         elif form.cancel.data:
             db.session.rollback()
-        # Clear search parameters
-        if "transactions" in session:
-            del session["transactions"]
-        session["transactions"] = [
-            transaction.transno for transaction in current_user.group().transactions
-        ]
+        clear_search()
         return redirect(url_for(".transactions_page"))
 
     form.process()  # Do this after validate_on_submit or breaks CSRF token
@@ -353,6 +406,7 @@ def modify_transaction(transno):
             transaction.description = form.description.data
             db.session.add(transaction)
             db.session.commit()
+            update_category_model(group, [transaction])
         elif form.delete.data:
             db.session.delete(transaction)
             db.session.commit()
@@ -369,6 +423,7 @@ def modify_transaction(transno):
 
 
 @web.route("/transactions/upload", methods=["GET", "POST"])
+@query_budget(100)  # Runs import jobs inline unless in the background
 @login_required
 def upload_transactions():
     """
@@ -382,25 +437,27 @@ def upload_transactions():
     account_names = [(account.accname, account.accname) for account in accounts]
     form.account.choices = account_names
     form.account.default = accounts[0].accname
+    form.date_format.choices = DATE_FORMAT_CHOICES
 
     if form.validate_on_submit():
         if form.upload.data:
             filename = secure_filename(form.transactions_file.data.filename)
-            temp_dir = mkdtemp(dir="uploads/")
-            csvfilename = temp_dir + "/" + filename
-            form.transactions_file.data.save(csvfilename)
-            session["transaction_csv_dir"] = temp_dir
-            session["transaction_csv_file"] = filename
-            transactions = []
-            with open(csvfilename, newline="") as csvfile:
-                reader = csv.reader(csvfile, delimiter=",")
-                for row in reader:
-                    if "".join(row).strip():  # Skip blank lines
-                        transactions.append(row)
-            session["uploaded_transactions"] = transactions
-            os.remove(csvfilename)
-            os.rmdir(temp_dir)
-            session["upload_account"] = form.account.data
+            delete_stale_uploads()
+            if filename.lower().endswith(".zip"):
+                return upload_archive(form, filename)
+            previous_upload = current_upload()
+            if previous_upload is not None:
+                delete_upload(previous_upload)
+            upload = create_upload(
+                current_user.group(),
+                form.account.data,
+                filename,
+                form.transactions_file.data.read(),
+                form.date_format.data,
+            )
+            session["upload_id"] = upload.upload_id
+            start_upload_job("parse_upload", upload)
+            return redirect(url_for(".upload_progress_page"))
 
         return redirect(url_for(".process_transactions"))
 
@@ -408,31 +465,37 @@ def upload_transactions():
 
 
 @web.route("/transactions/process", methods=["GET", "POST"])
+@query_budget(100)  # Runs import jobs inline unless in the background
 @login_required
 def process_transactions():
     """
     Process uploaded transactions.
 
-    Return a form for processing uploaded transactions or process submitted
-    form and redirect to Transactions HTML page.
+    Return a page of a form for processing uploaded transactions or process
+    submitted page, keeping its decisions on the upload, and go to another
+    page or import the upload.
     """
     form = ProcessUploadedTransactionsForm()
-    form.date_format.choices = [
-        ("DMY", "DD/MM/YY"),
-        ("MDY", "MM/DD/YY"),
-        ("YMD", "YY/MM/DD"),
-        ("YDM", "YY/DD/MM"),
-    ]
-
-    transactions = session["uploaded_transactions"]
-
-    predicted_categories = predict_categories()
-    predicted_columns, header_row = predict_columns()
+    form.date_format.choices = DATE_FORMAT_CHOICES
+
+    upload = current_upload()
+    if upload is not None and not ready_for_review(upload):
+        return redirect(url_for(".upload_progress_page"))
+    if upload is None or upload.num_rows == 0:
+        flash("No uploaded transactions, please upload a file.")
+        return redirect(url_for(".upload_transactions"))
+    page_size = current_app.config["REVIEW_PAGE_SIZE"]
+    num_pages = (upload.num_rows + page_size - 1) // page_size
+    page = min(max(request.args.get("page", 1, type=int), 1), num_pages)
+    start = (page - 1) * page_size
+    rows = review_upload_rows(upload, start, start + page_size)
+    transactions = [row.cells for row in rows]
 
     classify_cols_form = ClassifyTransactionColumnsForm()
     if request.method != "POST":
-        for _ in range(len(transactions[0])):
+        for _ in upload.column_labels:
             form.col_classifications.append_entry(classify_cols_form)
+        form.date_format.data = upload.date_format or "DMY"
     for num, subform in enumerate(form.col_classifications):
         subform.form.column_label.choices = [
             ("date", "Date"),
@@ -442,99 +505,68 @@ def process_transactions():
             ("drcr", "Debit/Credit"),
             ("ignore", "Ignore"),
         ]
-        subform.form.column_label.default = predicted_columns[num]  # 'date'
+        subform.form.column_label.default = upload.column_labels[num]  # 'date'
 
     classify_rows_form = ClassifyTransactionRowsForm()
     if request.method != "POST":
-        for _ in range(len(transactions)):
+        for _ in rows:
             form.row_classifications.append_entry(classify_rows_form)
     categories = current_user.group().categories
     category_names = [(category.catname, category.catname) for category in categories]
     actions = [("Keep", "Keep"), ("Ignore", "Ignore")]
-    for num, subform in enumerate(form.row_classifications):
+    for row, subform in zip(rows, form.row_classifications):
         subform.form.category_name.choices = category_names
-        subform.form.category_name.default = predicted_categories[num]
+        subform.form.category_name.default = row.catname
         subform.form.action.choices = actions
-        if num == 0 and header_row:
-            subform.form.action.default = "Ignore"
-            subform.form.category_name.default = "Unspecified Expense"
-        else:
-            subform.form.action.default = "Keep"
+        subform.form.action.default = row.action
 
     if form.validate_on_submit():
-        if form.add.data:
-            if not classifications_valid(form.col_classifications.data):
-                flash("Invalid classifications, please try again.")
-                return redirect(url_for(".process_transactions"))
-            for transno, transaction in enumerate(transactions):
-                action = form.row_classifications.data[transno]["action"]
-                if action == "Ignore":
-                    continue
-                amount = 0
-                date = ""
-                description = ""
-                for fieldno, field in enumerate(transaction):
-                    classification = form.col_classifications.data[fieldno][
-                        "column_label"
-                    ]
-                    if (
-                        transaction[fieldno].isspace()
-                        or transaction[fieldno] is None
-                        or not transaction[fieldno]
-                    ):
-                        continue
-                    if classification == "date":
-                        date = transaction[fieldno]
-                    elif classification == "description":
-                        description = transaction[fieldno]
-                    elif classification in ["dr", "cr", "drcr"]:
-                        amount = abs(float(transaction[fieldno]) * 100)
-                catname = form.row_classifications.data[transno]["category_name"]
-                accname = session["upload_account"]
-                if form.date_format.data == "DMY":
-                    current_user.group().add_transaction(
-                        amount=amount,
-                        date=date,
-                        catname=catname,
-                        accname=accname,
-                        description=description,
-                    )
-                elif form.date_format.data == "MDY":
-                    current_user.group().add_transaction(
-                        amount=amount,
-                        date=date,
-                        catname=catname,
-                        accname=accname,
-                        description=description,
-                        dayfirst=False,
-                    )
-                elif form.date_format.data == "YMD":
-                    current_user.group().add_transaction(
-                        amount=amount,
-                        date=date,
-                        catname=catname,
-                        accname=accname,
-                        description=description,
-                        dayfirst=False,
-                        yearfirst=True,
-                    )
-                elif form.date_format.data == "YDM":
-                    current_user.group().add_transaction(
-                        amount=amount,
-                        date=date,
-                        catname=catname,
-                        accname=accname,
-                        description=description,
-                        yearfirst=True,
-                    )
-                else:
-                    print("no valid date format")
-
-        db.session.commit()  # So that transactions get numbers
-        session["transactions"] = [
-            transaction.transno for transaction in current_user.group().transactions
+        if form.cancel.data:
+            delete_upload(upload)
+            session.pop("upload_id", None)
+            clear_search()
+            return redirect(url_for(".transactions_page"))
+        reviewed = [
+            {
+                "catname": classification["category_name"],
+                "action": classification["action"],
+            }
+            for classification in form.row_classifications.data[: len(rows)]
         ]
-        return redirect(url_for(".transactions_page"))
+        update_upload_rows(upload, start, reviewed)
+        column_labels = [
+            classification["column_label"]
+            for classification in form.col_classifications.data
+        ]
+        num_reflagged = 0
+        if (column_labels, form.date_format.data) != (
+            upload.column_labels,
+            upload.date_format or "DMY",
+        ):
+            upload.column_labels = column_labels
+            upload.date_format = form.date_format.data
+            num_reflagged = reflag_duplicate_rows(upload)
+        db.session.commit()
+        if num_reflagged:
+            flash(
+                "Likely duplicates changed for {} rows, please check them.".format(
+                    num_reflagged
+                )
+            )
+        if form.previous_page.data:
+            return redirect(url_for(".process_transactions", page=page - 1))
+        if form.next_page.data:
+            return redirect(url_for(".process_transactions", page=page + 1))
+        if num_reflagged:  # Show the changed rows before importing
+            return redirect(url_for(".process_transactions", page=page))
+        if not classifications_valid(form.col_classifications.data):
+            flash("Invalid classifications, please try again.")
+            return redirect(url_for(".process_transactions", page=page))
+        upload.num_kept = count_kept_rows(upload)
+        upload.status = "queued"
+        db.session.commit()
+        start_upload_job("import_upload", upload)
+        return redirect(url_for(".upload_progress_page"))
 
     for subform in form.row_classifications:
         subform.form.process()  # Ensure default values take effect
@@ -547,10 +579,183 @@ def process_transactions():
         form=form,
         transactions=transactions,
         num_transactions=len(transactions),
+        first_row=start + 1,
+        num_rows=upload.num_rows,
+        page=page,
+        num_pages=num_pages,
+        menu="transactions",
+    )
+
+
+@web.route("/transactions/progress")
+@login_required
+def upload_progress_page():
+    """
+    Show progress of the current upload's job.
+
+    Redirect to process the upload once it is parsed, or to Transactions
+    HTML page once it is imported.
+    """
+    upload = current_upload()
+    if upload is None:
+        flash("No uploaded transactions, please upload a file.")
+        return redirect(url_for(".upload_transactions"))
+    progress = upload_progress(upload)
+    if progress["status"] == "ready":
+        return redirect(url_for(".process_transactions"))
+    if progress["status"] == "done":
+        delete_upload(upload)
+        session.pop("upload_id", None)
+        flash("{} transactions imported.".format(progress["inserted"]))
+        clear_search()
+        return redirect(url_for(".transactions_page"))
+    return render_template(
+        "upload_progress.html",
+        progress=progress,
+        upload=upload,
+        reviewable=ready_for_review(upload),
         menu="transactions",
     )
 
 
+@web.route("/transactions/uploads/<int:upload_id>/status")
+@login_required
+def upload_status(upload_id):
+    """
+    Return status of an upload's job.
+
+    Returns JSON with the status and counts of rows parsed, predicted,
+    kept and inserted so far.
+    """
+    upload = get_upload(upload_id, current_user.group())
+    if upload is None:
+        return jsonify(error="Invalid upload."), 404
+    return jsonify(upload_progress(upload))
+
+
+@web.route("/transactions/batches/<int:batch_id>/")
+@login_required
+def upload_batch_page(batch_id):
+    """Show progress, throughput and errors of each file of a batch upload."""
+    batch = current_batch(batch_id)
+    if batch is None:
+        flash("Invalid upload.")
+        return redirect(url_for(".upload_transactions"))
+    report = batch_report(batch)
+    return render_template(
+        "upload_batch.html",
+        batch=batch,
+        report=report,
+        finished=batch_finished(report),
+        menu="transactions",
+    )
+
+
+@web.route("/transactions/batches/<int:batch_id>/status")
+@login_required
+def upload_batch_status(batch_id):
+    """Return JSON status of each file of a batch upload."""
+    batch = current_batch(batch_id)
+    if batch is None:
+        return jsonify(error="Invalid upload."), 404
+    report = batch_report(batch)
+    return jsonify(files=report, finished=batch_finished(report))
+
+
+@web.route("/transactions/batches/<int:batch_id>/finish")
+@login_required
+def finish_upload_batch(batch_id):
+    """Delete a finished batch upload and redirect to Transactions HTML page."""
+    batch = current_batch(batch_id)
+    if batch is not None and batch_finished(batch_report(batch)):
+        delete_upload_batch(batch)
+    clear_search()
+    return redirect(url_for(".transactions_page"))
+
+
+@web.route("/transactions/categorise", methods=["POST"])
+@login_required
+def categorise_transactions():
+    """
+    Categorise a batch of transaction descriptions.
+
+    Expects JSON {"descriptions": [...]} and returns JSON
+    {"categories": [...]} with a predicted category name per description.
+    """
+    data = request.get_json(silent=True) or {}
+    descriptions = data.get("descriptions")
+    if not isinstance(descriptions, list) or not all(
+        isinstance(description, str) for description in descriptions
+    ):
+        return jsonify(error="Expected a list of descriptions."), 400
+    if len(descriptions) > current_app.config["CATEGORISE_MAX_ROWS"]:
+        return jsonify(error="Too many descriptions."), 413
+    categories = categorise_descriptions(current_user.group(), descriptions)
+    return jsonify(categories=[str(catname) for catname in categories])
+
+
+def current_upload():
+    """Get the current user's upload of transactions, if any."""
+    return get_upload(session.get("upload_id"), current_user.group())
+
+
+def current_search():
+    """Get the criteria of the current user's saved search, else all criteria."""
+    criteria = load_search(session.get("search_id"), current_user.group())
+    return criteria or SearchCriteria()
+
+
+def clear_search():
+    """Delete the current user's saved search, so all transactions are listed."""
+    search_id = session.pop("search_id", None)
+    if search_id is not None:
+        delete_search(search_id, current_user.group())
+
+
+def current_batch(batch_id):
+    """Get the current user's batch upload, if any."""
+    batch = db.session.get(UploadBatch, batch_id)
+    if batch is None or batch.group_id != current_user.group().group_id:
+        return None
+    return batch
+
+
+def batch_finished(report):
+    """Check that every file of a batch upload is done or failed."""
+    return all(row["status"] in ("done", "failed") for row in report)
+
+
+def upload_archive(form, filename):
+    """Import each statement in an uploaded zip archive in its own job."""
+    group = current_user.group()
+    accnames = {account.accname for account in group.accounts}
+    try:
+        account_map = parse_account_map(form.account_map.data or "")
+        files = read_archive(form.transactions_file.data.read())
+    except (ValueError, zipfile.BadZipFile) as error:
+        flash("Invalid upload: {}".format(error))
+        return redirect(url_for(".upload_transactions"))
+    unknown = {accname for _, accname in account_map} - accnames
+    if unknown:
+        flash("Unknown accounts: {}".format(", ".join(sorted(unknown))))
+        return redirect(url_for(".upload_transactions"))
+    if not files:
+        flash("No files in archive, please upload another.")
+        return redirect(url_for(".upload_transactions"))
+    statements = [
+        (
+            secure_filename(name),
+            map_account(name, account_map, form.account.data),
+            content,
+        )
+        for name, content in files
+    ]
+    batch = create_upload_batch(group, filename, statements, form.date_format.data)
+    for upload in batch.uploads:
+        start_upload_job("import_file", upload)
+    return redirect(url_for(".upload_batch_page", batch_id=batch.batch_id))
+
+
 def classifications_valid(classifications):
     """Check that a valid set of classifications has been specified."""
     counts = {
@@ -675,16 +880,15 @@ def modify_category(catno):
             db.session.add(category)
             db.session.commit()
         elif form.delete.data:
-            for transaction in current_user.group().transactions:
-                if transaction.category == category:
-                    if category.cattype == "Expense":
-                        transaction.category = unspecified_expense
-                        db.session.add(transaction)
-                        db.session.commit()
-                    elif category.cattype == "Income":
-                        transaction.category = unspecified_income
-                        db.session.add(transaction)
-                        db.session.commit()
+            unspecified = {
+                "Expense": unspecified_expense,
+                "Income": unspecified_income,
+            }.get(category.cattype)
+            if unspecified is not None:
+                for transaction in Transaction.query.filter_by(
+                    group=group, category=category
+                ):
+                    transaction.category = unspecified
             db.session.delete(category)
             db.session.commit()
         return redirect(url_for(".categories_page"))
@@ -26,6 +26,27 @@ class Config:
     SESSION_COOKIE_HTTPONLY = True
     REMEMBER_COOKIE_HTTPONLY = True
     SESSION_TYPE = "filesystem"
+    CLASSIFIER_CACHE_SIZE = int(os.environ.get("CLASSIFIER_CACHE_SIZE", "16"))
+    CLASSIFIER_MODE = os.environ.get("CLASSIFIER_MODE", "batch")
+    CLASSIFIER_ALGORITHM = os.environ.get("CLASSIFIER_ALGORITHM", "gaussian_nb")
+    CLASSIFIER_FEATURES = os.environ.get("CLASSIFIER_FEATURES", "tfidf")
+    CLASSIFIER_PROCESSES = int(os.environ.get("CLASSIFIER_PROCESSES", "1"))
+    CLASSIFIER_MAX_TRANSACTIONS = int(
+        os.environ.get("CLASSIFIER_MAX_TRANSACTIONS", "50000")
+    )
+    CLASSIFIER_MAX_MONTHS = int(os.environ.get("CLASSIFIER_MAX_MONTHS", "0"))
+    CLASSIFIER_CATEGORY_QUOTA = int(os.environ.get("CLASSIFIER_CATEGORY_QUOTA", "0"))
+    CLASSIFIER_HALF_LIFE_MONTHS = float(
+        os.environ.get("CLASSIFIER_HALF_LIFE_MONTHS", "0")
+    )
+    CLASSIFIER_TRAINING = os.environ.get("CLASSIFIER_TRAINING", "inline")
+    WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", "2"))
+    WORKER_MAX_TASKS_PER_CHILD = int(os.environ.get("WORKER_MAX_TASKS_PER_CHILD", "10"))
+    CATEGORISE_MAX_ROWS = int(os.environ.get("CATEGORISE_MAX_ROWS", "10000"))
+    IMPORT_PROCESSING = os.environ.get("IMPORT_PROCESSING", "inline")
+    REVIEW_PAGE_SIZE = int(os.environ.get("REVIEW_PAGE_SIZE", "100"))
+    TRANSACTIONS_PAGE_SIZE = int(os.environ.get("TRANSACTIONS_PAGE_SIZE", "100"))
+    QUERY_BUDGET = int(os.environ.get("QUERY_BUDGET", "0"))
 
     @staticmethod
     def init_app(app):
@@ -46,10 +67,12 @@ class TestingConfig(Config):
     """Testing Flask Configuration."""
 
     TESTING = True
+    WTF_CSRF_ENABLED = False
     SQLALCHEMY_DATABASE_URI = os.environ.get(
         "TEST_DATABASE_URL"
     ) or "sqlite:///" + os.path.join(basedir, "data-test.sqlite")
     SERVER_NAME = "localhost.localdomain"
+    QUERY_BUDGET = int(os.environ.get("QUERY_BUDGET", "20"))
 
 
 class ProductionConfig(Config):
@@ -30,6 +30,13 @@ target_metadata = current_app.extensions["migrate"].db.metadata
 # ... etc.
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    """Leave out the full-text index of descriptions, made with raw DDL."""
+    return not (name or "").startswith(
+        ("transactions_fts", "ix_transactions_description_fts")
+    )
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -78,6 +85,7 @@ def run_migrations_online():
         connection=connection,
         target_metadata=target_metadata,
         process_revision_directives=process_revision_directives,
+        include_object=include_object,
         **current_app.extensions["migrate"].configure_args,
     )
 
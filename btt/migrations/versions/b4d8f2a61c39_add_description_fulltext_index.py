@@ -0,0 +1,63 @@
+"""add description full-text index
+
+Revision ID: b4d8f2a61c39
+Revises: a7e3d1c95b20
+Create Date: 2026-10-17 20:48:12.093356
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b4d8f2a61c39"
+down_revision = "a7e3d1c95b20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        op.execute(
+            "CREATE VIRTUAL TABLE transactions_fts USING fts5("
+            "description, content='transactions', content_rowid='transno')"
+        )
+        op.execute(
+            "CREATE TRIGGER transactions_fts_insert "
+            "AFTER INSERT ON transactions BEGIN "
+            "INSERT INTO transactions_fts(rowid, description) "
+            "VALUES (new.transno, new.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER transactions_fts_delete "
+            "AFTER DELETE ON transactions BEGIN "
+            "INSERT INTO transactions_fts(transactions_fts, rowid, description) "
+            "VALUES ('delete', old.transno, old.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER transactions_fts_update "
+            "AFTER UPDATE OF description ON transactions BEGIN "
+            "INSERT INTO transactions_fts(transactions_fts, rowid, description) "
+            "VALUES ('delete', old.transno, old.description); "
+            "INSERT INTO transactions_fts(rowid, description) "
+            "VALUES (new.transno, new.description); END"
+        )
+        # Index existing transactions
+        op.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('rebuild')")
+    elif dialect == "postgresql":
+        op.execute(
+            "CREATE INDEX ix_transactions_description_fts "
+            "ON transactions USING gin "
+            "(to_tsvector('simple', coalesce(description, '')))"
+        )
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        op.execute("DROP TRIGGER transactions_fts_update")
+        op.execute("DROP TRIGGER transactions_fts_delete")
+        op.execute("DROP TRIGGER transactions_fts_insert")
+        op.execute("DROP TABLE transactions_fts")
+    elif dialect == "postgresql":
+        op.execute("DROP INDEX ix_transactions_description_fts")